@@ -0,0 +1,131 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sqlite3
+import threading
+
+from cachecontrol import cache
+
+
+DEFAULT_CACHE_FILE = '~/.cache/os-trello/http-cache.sqlite'
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+# NOTE: how many reads are remembered before their access times are written
+ACCESS_BATCH_SIZE = 100
+
+
+class SQLiteCache(cache.BaseCache):
+    """A CacheControl cache that is kept on disk between runs.
+
+    Once the responses take up more than ``max_size`` bytes the least
+    recently used ones are evicted. Reads don't write to the database right
+    away; their access times are written in batches, along with the next
+    write, or when the cache is closed.
+    """
+
+    def __init__(self, filename, max_size=DEFAULT_MAX_SIZE):
+        filename = os.path.expanduser(filename)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # NOTE: the cache is shared by all of the sync workers
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            '  key TEXT PRIMARY KEY,'
+            '  value BLOB NOT NULL,'
+            '  size INTEGER NOT NULL,'
+            '  accessed INTEGER NOT NULL)')
+        self._conn.commit()
+        # NOTE: a counter orders accesses more reliably than the clock
+        self._accessed, self._total_size = self._conn.execute(
+            'SELECT COALESCE(MAX(accessed), 0), COALESCE(SUM(size), 0) '
+            'FROM responses').fetchone()
+        self._pending_accesses = {}  # indexed by key
+        # NOTE: the cached URLs contain API keys and tokens
+        os.chmod(filename, 0o600)
+
+    def _tick(self):
+        self._accessed += 1
+        return self._accessed
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._pending_accesses[key] = self._tick()
+            if len(self._pending_accesses) >= ACCESS_BATCH_SIZE:
+                self._write_accesses()
+                self._conn.commit()
+        return bytes(row[0])
+
+    def set(self, key, value, expires=None):
+        with self._lock:
+            self._remove(key)
+            self._conn.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?)',
+                (key, sqlite3.Binary(value), len(value), self._tick()))
+            self._total_size += len(value)
+            self._evict()
+            self._write_accesses()
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._write_accesses()
+            self._conn.commit()
+            self._conn.close()
+
+    def _remove(self, key):
+        self._pending_accesses.pop(key, None)
+        row = self._conn.execute('SELECT size FROM responses WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is not None:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._total_size -= row[0]
+
+    def _write_accesses(self):
+        if self._pending_accesses:
+            self._conn.executemany(
+                'UPDATE responses SET accessed = ? WHERE key = ?',
+                [(accessed, key) for key, accessed
+                 in self._pending_accesses.items()])
+            self._pending_accesses.clear()
+
+    def _evict(self):
+        if self._total_size <= self._max_size:
+            return
+
+        # NOTE: the order has to take the reads since the last write in
+        self._write_accesses()
+        evicted = []
+        rows = self._conn.execute(
+            'SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if self._total_size <= self._max_size:
+                break
+            evicted.append((key,))
+            self._total_size -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
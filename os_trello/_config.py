@@ -12,7 +12,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import yaml
+import copy
+import os
+
+from six.moves import cPickle as pickle
 
 
 class SettingNotFound(Exception):
@@ -30,9 +33,19 @@ class Config(object):
     call, avoiding the need to manually recurse the data structure.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, cache_file=None):
         self._filename = filename
-        self._data = yaml.load(open(filename))
+        self._data = load(filename, cache_file)
+
+    def overlay(self, overrides):
+        """Return a copy of the config with the overrides applied on top.
+
+        Sections are merged so an override only replaces the settings that
+        it actually has.
+        """
+        config = copy.copy(self)
+        config._data = _merge(self._data, overrides)
+        return config
 
     def get(self, setting, default=None):
         """C.get(setting[,default=None]) -> C[setting] if exists, else default.
@@ -51,3 +64,69 @@ class Config(object):
             except KeyError:
                 raise SettingNotFound(setting, self._filename)
         return current
+
+
+def _parse(filename):
+    # NOTE: yaml is slow to import and isn't needed when the cache is warm
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(filename) as f:
+        return yaml.load(f, Loader=loader)
+
+
+def load(filename, cache_file=None):
+    """Parse a YAML file, or reuse what it parsed to the last time.
+
+    The parsed data is pickled to ``cache_file`` along with the file's size
+    and modification time, and used for as long as they stay the same. Like
+    the config file, the cache holds credentials so only its owner can read
+    it.
+    """
+    if cache_file is None:
+        return _parse(filename)
+
+    stat = os.stat(filename)
+    key = [os.path.abspath(filename), stat.st_mtime, stat.st_size]
+    cached = _read_cache(cache_file)
+    if cached is not None and cached.get('key') == key:
+        return cached['data']
+
+    data = _parse(filename)
+    _write_cache(cache_file, dict(key=key, data=data))
+    return data
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None  # a missing or unreadable cache is simply replaced
+
+
+def _write_cache(cache_file, cached):
+    try:
+        directory = os.path.dirname(cache_file)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        tmp_filename = cache_file + '.tmp'
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)  # it could have been made readable
+        # NOTE: the file is created private rather than chmodded afterwards
+        # so that there is no moment when the secrets in it are readable
+        fd = os.open(tmp_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                     0o600)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(cached, f, protocol=2)
+        os.rename(tmp_filename, cache_file)
+    except (IOError, OSError):
+        pass  # the cache is only an optimization
+
+
+def _merge(base, overrides):
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge(merged[key], value)
+        merged[key] = value
+    return merged
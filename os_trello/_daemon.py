@@ -0,0 +1,153 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import json
+import logging
+import shlex
+import subprocess
+import threading
+import time
+
+import six
+
+
+logger = logging.getLogger('os_trello')
+
+DEFAULT_RESTART_DELAY = 30
+
+
+class Scheduler(object):
+    """Decide when each source is due to be synced again.
+
+    Every source has its own polling interval but can also be triggered
+    early, for instance when an event says that it changed.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._intervals = collections.OrderedDict()  # indexed by name
+        self._due = {}  # indexed by name
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def add(self, name, interval):
+        """Poll a source every ``interval`` seconds, starting right away."""
+        with self._lock:
+            self._intervals[name] = interval
+            self._due[name] = self._clock()
+
+    def trigger(self, name, delay=0):
+        """Make a source due in ``delay`` seconds unless it already is.
+
+        The delay lets a burst of events about a source share one sync.
+        """
+        with self._lock:
+            self._due[name] = min(self._due[name], self._clock() + delay)
+        self._wakeup.set()
+
+    def pop_due(self):
+        """Return the sources that are due and schedule their next poll."""
+        with self._lock:
+            now = self._clock()
+            names = [name for name in self._intervals
+                     if self._due[name] <= now]
+            for name in names:
+                self._due[name] = now + self._intervals[name]
+        return names
+
+    def wait(self):
+        """Block until a source is due, then return the ones that are."""
+        while True:
+            names = self.pop_due()
+            if names:
+                return names
+            with self._lock:
+                timeout = min(self._due.values()) - self._clock()
+            self._wakeup.wait(max(0, timeout))
+            self._wakeup.clear()
+
+
+class EventFeed(object):
+    """Follow the JSON events printed by a command, one per line.
+
+    The command is normally ``ssh -p 29418 <user>@<host> gerrit
+    stream-events`` but anything that prints events in the same format, like
+    ``tail -f`` on a file, works too. The command is started again if it
+    exits since ssh connections don't last forever.
+    """
+
+    def __init__(self, command, callback,
+                 restart_delay=DEFAULT_RESTART_DELAY, popen=subprocess.Popen):
+        if isinstance(command, six.string_types):
+            command = shlex.split(command)
+        self._command = command
+        self._callback = callback
+        self._restart_delay = restart_delay
+        self._popen = popen
+        self._process = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run,
+                                        name='os-trello-events')
+        # NOTE: a blocked read must not keep the process alive at exit
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._follow()
+            except Exception:
+                logger.exception('error following %s', self._command[0])
+            if not self._stopped.wait(self._restart_delay):
+                logger.info('restarting %s', self._command[0])
+
+    def _follow(self):
+        self._process = self._popen(self._command, stdout=subprocess.PIPE)
+        try:
+            for line in iter(self._process.stdout.readline, b''):
+                self.handle(line)
+        finally:
+            self._process.stdout.close()
+            self._process.wait()
+
+    def handle(self, line):
+        try:
+            event = json.loads(line.decode('utf-8'))
+        except ValueError:
+            logger.debug('ignoring malformed event: %r', line)
+            return
+        self._callback(event)
+
+
+def gerrit_event_change(event):
+    """Return the change number and owner's username that an event is about.
+
+    Events that aren't about a change, like ref-updated, return
+    ``(None, None)``.
+    """
+    change = event.get('change')
+    if not change:
+        return None, None
+    number = change.get('number')
+    return (int(number) if number is not None else None,
+            change.get('owner', {}).get('username'))
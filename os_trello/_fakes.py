@@ -0,0 +1,521 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import json
+import random
+import re
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves import urllib
+
+from os_trello import _stats
+from os_trello import _trello
+from os_trello import _utils
+
+
+TRELLO_HOST = 'trello.com'
+GERRIT_HOST = 'review.openstack.org'
+LAUNCHPAD_HOST = 'api.launchpad.net'
+LAUNCHPAD_URL = 'https://%s/1.0' % LAUNCHPAD_HOST
+
+BOARD_ALIAS = 'benchmark'
+PROJECTS = ('keystone', 'nova', 'glance', 'neutron', 'cinder', 'swift',
+            'horizon', 'heat', 'oslo.config', 'python-keystoneclient')
+LISTS = (_trello.NEEDS_WORK_LIST, _trello.IN_PROGRESS_LIST,
+         _trello.COMPLETED_LIST, _trello.GATING_LIST, _trello.DONE_LIST)
+UPDATED = '2015-06-01 10:00:00.000000000'
+ACCOUNT_ID = 1000000  # the benchmark user's; everyone else is the next one
+
+
+class _Ids(object):
+
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            self._last += 1
+            return '%024x' % self._last
+
+
+def _review_labels(change, username):
+    if change['owner']['username'] == username:
+        return [_trello.CODE_LABEL, change['project'].split('/')[-1]]
+    return [_trello.REVIEW_LABEL, change['project'].split('/')[-1]]
+
+
+class FixtureBuilder(object):
+    """Build a synthetic board along with the reviews and bugs synced to it.
+
+    Most of the reviews and bugs already have an up to date card. A
+    ``churn`` fraction of them have no card or have a card in the wrong
+    list, and as many orphaned cards are added. The rest of the cards are
+    ones that were added by hand.
+    """
+
+    def __init__(self, cards=10000, reviews=2000, bugs=500, churn=0.05,
+                 username='benchmark', seed=0):
+        self.cards = cards
+        self.reviews = reviews
+        self.bugs = bugs
+        self.churn = churn
+        self.username = username
+        self._random = random.Random(seed)
+        self._ids = _Ids()
+        self._board = None
+
+    def build(self):
+        self._board = dict(id=self._ids.next(), name='Benchmark',
+                           lists=[], labels=[], cards=[])
+        for name in LISTS:
+            self._board['lists'].append(dict(id=self._ids.next(), name=name))
+        changes = [self._change(i) for i in range(self.reviews)]
+        tasks = [self._task(i) for i in range(self.bugs)]
+
+        for change in changes:
+            revision = change['revisions'][change['current_revision']]
+            # NOTE: the sync writes the commit message without the #s
+            self._maybe_add_card(
+                '[%d] %s' % (change['_number'], change['subject']),
+                _review_labels(change, self.username),
+                revision['commit']['message'].replace('#', ''))
+        for task in tasks:
+            self._maybe_add_card(
+                'Bug #%s %s' % (task['bug_link'].rsplit('/')[-1],
+                                task['title'].split('"')[1]),
+                [_trello.BUG_LABEL, task['target_link'].rsplit('/')[-1]])
+        for i in range(int(self.churn * (self.reviews + self.bugs))):
+            self._add_card('[%d] Orphaned review' % (900000 + i), [])
+        for i in range(max(0, self.cards - len(self._board['cards']))):
+            self._add_card('Note %d' % i, [])
+
+        return dict(username=self.username, board=self._board,
+                    changes=changes, tasks=tasks)
+
+    def _change(self, i):
+        project = self._random.choice(PROJECTS)
+        owner = self.username if self._random.random() < 0.3 else 'other'
+        revision = '%040x' % i
+        return {
+            'id': 'I%040x' % i,
+            '_number': 100000 + i,
+            'project': 'openstack/%s' % project,
+            'status': 'NEW',
+            'subject': 'Change %d to %s' % (i, project),
+            'updated': UPDATED,
+            'owner': {'_account_id': (ACCOUNT_ID if owner == self.username
+                                      else ACCOUNT_ID + 1),
+                      'username': owner},
+            'starred': owner != self.username,
+            'labels': {'Workflow': {}, 'Code-Review': {'all': []}},
+            'current_revision': revision,
+            'revisions': {revision: {'commit': {
+                'message': 'Change %d\n\nCloses-Bug: #%d\n' % (i, i)}}},
+        }
+
+    def _task(self, i):
+        project = self._random.choice(PROJECTS)
+        number = 1000000 + i
+        return {
+            'bug_link': '%s/bugs/%d' % (LAUNCHPAD_URL, number),
+            'title': 'Bug #%d in %s: "Bug %d"' % (number, project, i),
+            'status': 'Confirmed',
+            'target_link': '%s/%s' % (LAUNCHPAD_URL, project),
+            'web_link': 'https://bugs.launchpad.net/%s/+bug/%d' % (
+                project, number),
+            'assigned': i % 2 == 0,
+        }
+
+    def _label_id(self, name):
+        for label in self._board['labels']:
+            if label['name'] == name:
+                return label['id']
+        label = dict(id=self._ids.next(), name=name, color='green')
+        self._board['labels'].append(label)
+        return label['id']
+
+    def _add_card(self, name, label_names, list_index=0, desc=''):
+        self._board['cards'].append(dict(
+            id=self._ids.next(), name=name, desc=desc,
+            idList=self._board['lists'][list_index]['id'],
+            idLabels=[self._label_id(n) for n in label_names]))
+
+    def _maybe_add_card(self, name, label_names, desc=''):
+        roll = self._random.random()
+        if roll < self.churn / 2:
+            return  # it will be created
+        # NOTE: the rest of the churn is in the wrong list and gets moved
+        self._add_card(name, label_names, 1 if roll < self.churn else 0,
+                       desc)
+
+
+class RequestCounter(object):
+    """Count the requests made to each endpoint of the fake services."""
+
+    def __init__(self):
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def count(self, service, method, path, status=None):
+        endpoint = '%s %s %s' % (service, method, _stats.endpoint(path))
+        if status is not None:
+            endpoint += ' (%d)' % status
+        with self._lock:
+            self._counts[endpoint] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def _first(values, default=None):
+    return values[0] if values else default
+
+
+class FakeTrello(object):
+
+    name = 'trello'
+
+    def __init__(self, board):
+        self.board = board
+        self.cards = collections.OrderedDict((c['id'], c)
+                                             for c in board.pop('cards'))
+        self.actions = []
+        self._ids = _Ids()
+        # NOTE: ids must not collide with the ones in the fixtures
+        self._ids._last = 1 << 64
+        self._lock = threading.Lock()
+        self._act('createBoard', board=dict(id=board['id']))
+        self.routes = [
+            ('GET', re.compile(r'^/1/boards/[^/]+$'), self.get_board),
+            ('GET', re.compile(r'^/1/boards/[^/]+/actions$'),
+             self.get_actions),
+            ('GET', re.compile(r'^/1/cards/([^/]+)$'), self.get_card),
+            ('POST', re.compile(r'^/1/cards/?$'), self.create_card),
+            ('PUT', re.compile(r'^/1/cards/([^/]+)$'), self.update_card),
+            ('PUT', re.compile(r'^/1/cards/([^/]+)/idList$'),
+             self.move_card),
+            ('POST', re.compile(r'^/1/cards/([^/]+)/idLabels$'),
+             self.add_label),
+            ('DELETE', re.compile(r'^/1/cards/([^/]+)$'), self.delete_card),
+            ('POST', re.compile(r'^/1/labels/?$'), self.create_label),
+            ('POST', re.compile(r'^/1/lists/?$'), self.create_list),
+        ]
+
+    def _act(self, action_type, **data):
+        self.actions.append(dict(id=self._ids.next(), type=action_type,
+                                 data=data))
+
+    def get_board(self, query, form):
+        with self._lock:
+            snapshot = dict(self.board, cards=list(self.cards.values()))
+            snapshot['actions'] = [dict(id=a['id'])
+                                   for a in self.actions[-1:]]
+        return 200, snapshot
+
+    def get_actions(self, query, form):
+        since = _first(query.get('since'), '')
+        limit = int(_first(query.get('limit'), 50))
+        with self._lock:
+            actions = [a for a in self.actions if a['id'] > since]
+        return 200, list(reversed(actions))[:limit]
+
+    def get_card(self, query, form, card_id):
+        card = self.cards.get(card_id)
+        return (200, card) if card else (404, {})
+
+    def create_card(self, query, form):
+        card = dict(id=self._ids.next(), name=_first(form.get('name')),
+                    desc=_first(form.get('desc'), ''),
+                    idList=_first(form.get('idList')),
+                    idLabels=form.get('idLabels', []))
+        with self._lock:
+            self.cards[card['id']] = card
+            self._act('createCard', card=dict(id=card['id']))
+        return 200, card
+
+    def update_card(self, query, form, card_id):
+        with self._lock:
+            card = self.cards[card_id]
+            for key, values in form.items():
+                card[key] = values[0]
+            if 'idLabels' in form:
+                card['idLabels'] = [i for i in form['idLabels'][0].split(',')
+                                    if i]
+            if card.get('closed') == 'true':
+                # NOTE: the board snapshot only has the open cards
+                card['closed'] = True
+                del self.cards[card_id]
+            self._act('updateCard', card=dict(card))
+        return 200, card
+
+    def move_card(self, query, form, card_id):
+        return self.update_card(query, dict(idList=form['value']), card_id)
+
+    def add_label(self, query, form, card_id):
+        label_id = form['value'][0]
+        with self._lock:
+            self.cards[card_id]['idLabels'].append(label_id)
+            self._act('addLabelToCard', card=dict(id=card_id),
+                      label=dict(id=label_id))
+        return 200, self.cards[card_id]['idLabels']
+
+    def delete_card(self, query, form, card_id):
+        with self._lock:
+            if self.cards.pop(card_id, None) is None:
+                return 404, {}
+            self._act('deleteCard', card=dict(id=card_id))
+        return 200, {}
+
+    def _create(self, kind, action_type, form, fields):
+        entity = dict(id=self._ids.next())
+        for field in fields:
+            entity[field] = _first(form.get(field))
+        with self._lock:
+            self.board[kind].append(entity)
+            self._act(action_type, **{kind[:-1]: entity})
+        return 200, entity
+
+    def create_label(self, query, form):
+        return self._create('labels', 'createLabel', form, ('name', 'color'))
+
+    def create_list(self, query, form):
+        return self._create('lists', 'createList', form, ('name',))
+
+
+class FakeGerrit(object):
+
+    name = 'gerrit'
+
+    def __init__(self, changes, username):
+        self.changes = changes
+        self.username = username
+        self._by_number = dict((str(c['_number']), c) for c in changes)
+        self.routes = [
+            ('GET', re.compile(r'^/a/changes/$'), self.query_changes),
+            ('GET', re.compile(r'^/a/changes/(\d+)/revisions/([^/]+)/commit$'),
+             self.get_commit),
+            ('GET', re.compile(r'^/a/accounts/self$'), self.get_account),
+        ]
+
+    def _reply(self, data):
+        return 200, (")]}'\n" + json.dumps(data)).encode('utf-8')
+
+    def _matches(self, change, query):
+        if 'is:starred' in query and not change['starred']:
+            return False
+        if 'owner:self' in query and (change['owner']['username'] !=
+                                      self.username):
+            return False
+        after = re.search(r'after:"([^"]+) \+0000"', query)
+        return not after or change['updated'][:19] > after.group(1)
+
+    def query_changes(self, query, form):
+        q = _first(query.get('q'), '')
+        size = int(_first(query.get('n'), 500))
+        start = int(_first(query.get('S'), 0))
+        options = query.get('o', [])
+        matched = [c for c in self.changes if self._matches(c, q)]
+        page = [_project(c, options) for c in matched[start:start + size]]
+        if page and start + size < len(matched):
+            page[-1]['_more_changes'] = True
+        return self._reply(page)
+
+    def get_commit(self, query, form, number, revision):
+        change = self._by_number.get(number)
+        if not change:
+            return 404, {}
+        if revision == 'current':
+            revision = change['current_revision']
+        return self._reply(change['revisions'][revision]['commit'])
+
+    def get_account(self, query, form):
+        return self._reply(dict(_account_id=ACCOUNT_ID,
+                                username=self.username))
+
+
+def _project(change, options):
+    """Leave out the parts of a change that the query didn't ask for."""
+    change = dict(change)
+    if 'CURRENT_COMMIT' not in options:
+        change['revisions'] = dict((revision, {})
+                                   for revision in change['revisions'])
+    if 'DETAILED_ACCOUNTS' not in options:
+        change['owner'] = dict(_account_id=change['owner']['_account_id'])
+    return change
+
+
+class FakeLaunchpad(object):
+
+    name = 'launchpad'
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.routes = [
+            ('GET', re.compile(r'^/1.0/~([^/]+)$'), self.search_tasks),
+            ('GET', re.compile(r'^/1.0/bugs/(\d+)$'), self.get_bug),
+        ]
+
+    def search_tasks(self, query, form, username):
+        if 'assignee' in query:
+            tasks = [t for t in self.tasks if t['assigned']]
+        else:
+            tasks = [t for t in self.tasks if not t['assigned']]
+        size = int(_first(query.get('ws.size'), 75))
+        start = int(_first(query.get('ws.start'), 0))
+        page = dict(total_size=len(tasks), start=start,
+                    entries=tasks[start:start + size])
+        if start + size < len(tasks):
+            params = [(k, v) for k in sorted(query) for v in query[k]
+                      if k != 'ws.start'] + [('ws.start', start + size)]
+            page['next_collection_link'] = '%s/~%s?%s' % (
+                LAUNCHPAD_URL, username, urllib.parse.urlencode(params))
+        return 200, page
+
+    def get_bug(self, query, form, number):
+        return 200, dict(id=int(number),
+                         description='Something is broken in %s' % number)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # NOTE: keep-alive so that connection reuse shows up in the results
+    protocol_version = 'HTTP/1.1'
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = self.rfile.read(length).decode('utf-8')
+        return urllib.parse.parse_qs(body, keep_blank_values=True)
+
+    def _route(self, path, query, form):
+        service = self.server.service
+        for method, regex, handler in service.routes:
+            match = regex.match(path)
+            if method == self.command and match:
+                return handler(query, form, *match.groups())
+        return 404, {}
+
+    def _dispatch(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query, keep_blank_values=True)
+        form = self._read_form()
+        time.sleep(self.server.latency)
+        if parts.path == '/_stats':
+            status, body = 200, self.server.counter.snapshot()
+        else:
+            status, body = self._route(parts.path, query, form)
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        # NOTE: like the real services, answer a GET for something that
+        # hasn't changed with a 304 so the HTTP cache gets exercised
+        etag = None
+        if self.command == 'GET' and status == 200:
+            etag = '"%s"' % _utils.content_hash(body)
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+        self.server.counter.count(self.server.service.name, self.command,
+                                  parts.path, 304 if status == 304 else None)
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class FakeServices(object):
+    """Serve fixtures from local stand-ins for Trello, Gerrit and Launchpad.
+
+    Every request is delayed by ``latency`` seconds and counted by
+    endpoint; the counts are served from ``/_stats`` on each service.
+    """
+
+    def __init__(self, fixtures, latency=0.0, address='127.0.0.1'):
+        self.counter = RequestCounter()
+        self.latency = latency
+        self._address = address
+        self._services = [
+            (TRELLO_HOST, FakeTrello(fixtures['board'])),
+            (GERRIT_HOST, FakeGerrit(fixtures['changes'],
+                                     fixtures['username'])),
+            (LAUNCHPAD_HOST, FakeLaunchpad(fixtures['tasks'])),
+        ]
+        self._servers = []
+
+    @property
+    def hosts(self):
+        """Map each real host to the address of its stand-in."""
+        return dict((host, 'http://%s:%d' % server.server_address)
+                    for (host, _), server in zip(self._services,
+                                                 self._servers))
+
+    def start(self):
+        for host, service in self._services:
+            server = _Server((self._address, 0), _Handler)
+            server.service = service
+            server.latency = self.latency
+            server.counter = self.counter
+            thread = threading.Thread(target=server.serve_forever,
+                                      kwargs=dict(poll_interval=0.1),
+                                      name='fake-%s' % service.name)
+            thread.daemon = True
+            thread.start()
+            self._servers.append(server)
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+
+def serve(queue, fixtures_file=None, save_fixtures=None, latency=0.0,
+          **build_options):
+    """Serve the fixtures until the process is terminated.
+
+    This is the target of the benchmark's server process. The fixtures are
+    read from ``fixtures_file`` or built from ``build_options``, and the
+    hosts of the services are put on the queue once they're up.
+    """
+    if fixtures_file:
+        with open(fixtures_file) as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = FixtureBuilder(**build_options).build()
+    if save_fixtures:
+        with open(save_fixtures, 'w') as f:
+            json.dump(fixtures, f)
+
+    services = FakeServices(fixtures, latency)
+    services.start()
+    queue.put(services.hosts)
+    threading.Event().wait()
@@ -14,6 +14,8 @@
 
 import json
 import logging
+import re
+import time
 
 import requests
 from six.moves import urllib
@@ -23,6 +25,13 @@ from os_trello import _utils
 
 logger = logging.getLogger('os_trello')
 
+DEFAULT_FULL_SYNC_INTERVAL = 24 * 60 * 60
+DEFAULT_PAGE_SIZE = 100
+# NOTE: search operators whose results depend on who is asking
+USER_RELATIVE_QUERY_RE = re.compile(
+    r'\bself\b|\b(?:is|has):(?:starred|star|watched|reviewer|owner|draft|'
+    r'edit|ignored)\b')
+
 
 class GerritReview(object):
 
@@ -32,14 +41,30 @@ class GerritReview(object):
     project = _utils.data_property('project')
     status = _utils.data_property('status')
     subject = _utils.data_property('subject')
+    updated = _utils.data_property('updated')
 
-    def __init__(self, review_data):
+    def __init__(self, review_data, gerrit=None):
         self._data = review_data
+        self._gerrit = gerrit
+
+    @property
+    def current_revision(self):
+        return self._data.get('current_revision')
+
+    @property
+    def owner_account_id(self):
+        return self._data['owner']['_account_id']
 
     @property
     def commit_message(self):
-        revision = self._data['revisions'].values()[0]  # we only get the last one
-        return revision['commit']['message']
+        # we only get the last one
+        revisions = self._data.get('revisions', {})
+        commit = next(iter(revisions.values()), {}).get('commit')
+        if commit:
+            return commit['message']
+        # NOTE: the query didn't include the commit; it is fetched on its own
+        return self._gerrit.get_commit_message(self.number,
+                                               self.current_revision)
 
     @property
     def url(self):
@@ -48,9 +73,16 @@ class GerritReview(object):
 
 class Gerrit(object):
 
-    def __init__(self, base_url, username, password):
+    def __init__(self, base_url, username, password, session=None,
+                 page_size=DEFAULT_PAGE_SIZE, query_cache=None,
+                 fetch_commits=True, commit_cache=None):
         self._base_url = base_url
-        self.session = requests.Session()
+        self._username = username
+        self._page_size = page_size
+        self._query_cache = query_cache
+        self.fetch_commits = fetch_commits
+        self._commit_cache = commit_cache or _utils.FetchOnce()
+        self.session = session or requests.Session()
         self.auth = requests.auth.HTTPDigestAuth(username, password)
 
     def _url(self, fragment):
@@ -62,17 +94,68 @@ class Gerrit(object):
         return json.loads(resp.text.lstrip(")]}'"))
 
     def run_query(self, query):
+        """Return an iterator of the reviews matching the query.
+
+        Without a query cache the reviews are fetched a page at a time as
+        they are iterated over. With one, a query that was already run by
+        any Gerrit client sharing the cache isn't run again, which means
+        holding on to all of its results. Queries relative to the user, like
+        is:starred, are only shared between clients for the same user, and
+        results without commit messages aren't shared with clients that
+        want them.
+        """
+        if self._query_cache is None:
+            return self._run_query(query)
+        key = (self._base_url, query, self.fetch_commits)
+        if USER_RELATIVE_QUERY_RE.search(query):
+            key += (self._username,)
+        return iter(self._query_cache.get(
+            key, lambda: list(self._run_query(query))))
+
+    @_utils.memoized_property
+    def account_id(self):
+        """The id of the account that the queries are run as.
+
+        Changes only carry the ids of their owner's and voters' accounts
+        unless their details are asked for, so they are compared by id.
+        """
+        return self._request('/a/accounts/self')['_account_id']
+
+    def get_commit_message(self, number, revision=None):
+        """Fetch the commit message of a change's revision, only once."""
+        revision = revision or 'current'
+        return self._commit_cache.get(
+            (self._base_url, number, revision),
+            lambda: self._request('/a/changes/%s/revisions/%s/commit' % (
+                number, revision))['message'])
+
+    def _run_query(self, query):
+        """Yield the reviews matching the query, one page at a time.
+
+        Gerrit marks the last change of a page with _more_changes when
+        there are more to fetch, so only one page is held in memory.
+        Without ``fetch_commits`` the commit messages, which are most of
+        a change's size, are left out and fetched when they're needed.
+        """
         logger.info('running Gerrit query %r', query)
-        query = [
-            ('q', query),
-            ('o', 'CURRENT_REVISION'),
-            ('o', 'CURRENT_COMMIT'),
-            ('o', 'DETAILED_LABELS'),
-            ('o', 'DETAILED_ACCOUNTS'),
-        ]
-        qs = urllib.parse.urlencode(query)
-        for review_data in self._request('/a/changes/?%s' % qs):
-            yield GerritReview(review_data)
+        start = 0
+        while True:
+            params = [('q', query), ('o', 'CURRENT_REVISION')]
+            if self.fetch_commits:
+                params.append(('o', 'CURRENT_COMMIT'))
+            params += [
+                ('o', 'DETAILED_LABELS'),
+                ('n', self._page_size),
+                ('S', start),
+            ]
+            qs = urllib.parse.urlencode(params)
+            page = self._request('/a/changes/?%s' % qs)
+            for review_data in page:
+                yield GerritReview(review_data, self)
+
+            if not page or not page[-1].get('_more_changes'):
+                return
+            start += len(page)
 
     def unstar(self, change_id):
         logger.info('unstarring %s', change_id)
@@ -80,3 +163,63 @@ class Gerrit(object):
             self._url('/a/accounts/self/starred.changes/%s' % change_id),
             auth=self.auth)
         resp.raise_for_status()
+
+
+class IncrementalQuery(object):
+    """Run a query, only fetching the changes updated since the last run.
+
+    The newest ``updated`` timestamp and the numbers of the changes that
+    matched are kept in the state. Changes that aren't returned by an
+    incremental run are assumed to still match the query. A full query is
+    run every ``full_sync_interval`` seconds to notice the ones that don't.
+    """
+
+    def __init__(self, gerrit, query, state,
+                 full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL,
+                 clock=time.time):
+        self._gerrit = gerrit
+        self._query = query
+        self._state = state
+        self._full_sync_interval = full_sync_interval
+        self._clock = clock
+        self.unchanged_numbers = set()
+
+    def run(self):
+        """Yield the reviews that changed since the last run.
+
+        They are yielded as they are fetched. The state and
+        ``unchanged_numbers`` are only updated once they all have been.
+        """
+        queries = self._state.setdefault('gerrit', {})
+        previous = queries.get(self._query)
+        now = self._clock()
+
+        if (not previous or not previous['updated'] or
+                now - previous['full_sync'] >= self._full_sync_interval):
+            reviews = self._gerrit.run_query(self._query)
+            seen_numbers = set()
+            updated = None
+            full_sync = now
+        else:
+            # NOTE: Gerrit timestamps are UTC and after: is inclusive so
+            # the newest change from the last run is fetched again.
+            query = '%s after:"%s +0000"' % (self._query, previous['updated'])
+            reviews = self._gerrit.run_query(query)
+            seen_numbers = set(previous['seen'])
+            updated = previous['updated']
+            full_sync = previous['full_sync']
+
+        fetched_numbers = set()
+        for review in reviews:
+            fetched_numbers.add(review.number)
+            timestamp = review.updated[:19]  # drop the nanoseconds
+            if updated is None or timestamp > updated:
+                updated = timestamp
+            yield review
+
+        self.unchanged_numbers = seen_numbers - fetched_numbers
+        queries[self._query] = {
+            'updated': updated,
+            'seen': sorted(seen_numbers | fetched_numbers),
+            'full_sync': full_sync,
+        }
@@ -0,0 +1,264 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import cachecontrol
+from cachecontrol import cache as cachecontrol_cache
+import requests
+from requests import adapters
+from six.moves import urllib
+
+from os_trello import _cache
+from os_trello import _stats
+
+
+logger = logging.getLogger('os_trello')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+MAX_BACKOFF = 60
+RETRY_STATUSES = (429, 503)
+# NOTE: a 429 means the request was turned away before it was handled, but
+# a 503 may come after a POST went through; retrying it could create a card
+# twice
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class TokenBucket(object):
+    """Allow up to ``rate`` requests per second with bursts of ``burst``."""
+
+    def __init__(self, rate, burst, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """Take a token, blocking until one is available."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        # NOTE: the token is already spoken for so other threads will queue
+        # up behind us instead of racing for the next one.
+        if wait:
+            self._sleep(wait)
+
+
+def is_retryable(method, status_code):
+    """Is it safe, and worth it, to send the request again?"""
+    if status_code == 429:
+        return True
+    return status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+
+
+def parse_retry_after(value, clock=time.time):
+    """Return the number of seconds a Retry-After header asks us to wait.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - clock())
+
+
+class Transport(object):
+    """HTTP settings shared by the Trello, Gerrit and Launchpad clients.
+
+    The transport owns one token bucket per rate limited host so that every
+    session it creates draws from the same limits. It also owns the response
+    cache; without one, responses are only cached in memory.
+    """
+
+    def __init__(self, rate_limits=None, pool_size=DEFAULT_POOL_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, cache=None,
+                 hosts=None, stats=None):
+        self.cache = cache or cachecontrol_cache.DictCache()
+        self.stats = stats or _stats.Registry()
+        self.hosts = hosts or {}
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._buckets = {}
+        for host, limit in (rate_limits or {}).items():
+            rate = limit['rate']
+            self._buckets[host] = TokenBucket(rate, limit.get('burst', rate))
+
+    @classmethod
+    def from_config(cls, config, stats=None):
+        cache = None
+        if config.get('http.cache'):
+            cache = _cache.SQLiteCache(
+                config.get('http.cache.file', _cache.DEFAULT_CACHE_FILE),
+                config.get('http.cache.max_size', _cache.DEFAULT_MAX_SIZE))
+        return cls(rate_limits=config.get('http.rate_limits'),
+                   pool_size=config.get('http.pool_size', DEFAULT_POOL_SIZE),
+                   max_retries=config.get('http.max_retries',
+                                          DEFAULT_MAX_RETRIES),
+                   backoff_factor=config.get('http.backoff_factor',
+                                             DEFAULT_BACKOFF_FACTOR),
+                   cache=cache,
+                   hosts=config.get('http.hosts'),
+                   stats=stats)
+
+    def close(self):
+        """Write out anything the response cache is still holding on to."""
+        self.cache.close()
+
+    def bucket(self, host):
+        return self._buckets.get(host)
+
+    def rewrite(self, url):
+        """Send requests for a host in ``hosts`` to the URL it maps to.
+
+        This points the clients at a local stand-in for a service, such as
+        the benchmark's fake servers, without any other configuration.
+        """
+        parts = urllib.parse.urlsplit(url)
+        base_url = self.hosts.get(parts.hostname)
+        if base_url is None:
+            return url
+        base = urllib.parse.urlsplit(base_url)
+        return urllib.parse.urlunsplit(
+            (base.scheme, base.netloc, base.path.rstrip('/') + parts.path,
+             parts.query, parts.fragment))
+
+    def retry_delay(self, response, attempt):
+        """How long to wait before retrying a throttled response.
+
+        A Retry-After header is honoured, but only up to ``MAX_BACKOFF`` so
+        that a bogus one can't stall a run.
+        """
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return min(MAX_BACKOFF, retry_after)
+        # NOTE: full jitter keeps the parallel sync workers from retrying
+        # in lock step.
+        ceiling = min(MAX_BACKOFF, self.backoff_factor * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def session(self, cache=False):
+        """Return a new session that sends all requests through us.
+
+        When ``cache`` is true responses are also cached with CacheControl.
+        Responses with an ETag or Last-Modified header are revalidated with
+        a conditional request so unchanged resources come back as a 304.
+        """
+        session = requests.Session()
+        if cache:
+            adapter = CachingRateLimitedAdapter(cache=self.cache,
+                                                transport=self)
+        else:
+            adapter = RateLimitedAdapter(transport=self)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+class RateLimitedAdapter(adapters.HTTPAdapter):
+    """Throttle requests per host and retry the ones that were throttled."""
+
+    def __init__(self, transport, **kwargs):
+        self._transport = transport
+        kwargs.setdefault('pool_connections', transport.pool_size)
+        kwargs.setdefault('pool_maxsize', transport.pool_size)
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, *args, **kwargs):
+        bucket = self._transport.bucket(
+            urllib.parse.urlparse(request.url).hostname)
+        labels = _stats.request_labels(request.method, request.url)
+        url = self._transport.rewrite(request.url)
+        if url != request.url:
+            # NOTE: only the copy that is sent goes to the rewritten URL;
+            # build_response puts the original back for the cache
+            original_url = request.url
+            request = request.copy()
+            request.url = url
+            request.original_url = original_url
+        attempt = 0
+        while True:
+            if bucket:
+                with self._transport.stats.timer('http_throttled_seconds',
+                                                 host=labels['host']):
+                    bucket.acquire()
+            response = self._send(request, labels, *args, **kwargs)
+            if (not is_retryable(request.method, response.status_code)
+                    or attempt >= self._transport.max_retries):
+                return response
+
+            self._transport.stats.count('http_retries_total', **labels)
+            delay = self._transport.retry_delay(response, attempt)
+            logger.warning('%s %s returned %d; retrying in %.1fs',
+                           request.method, request.url.split('?')[0],
+                           response.status_code, delay)
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, request, labels, *args, **kwargs):
+        stats = self._transport.stats
+        with stats.timer('http_request_seconds', **labels):
+            response = super(RateLimitedAdapter, self).send(
+                request, *args, **kwargs)
+        stats.count('http_requests_total', status=response.status_code,
+                    **labels)
+        return response
+
+
+class CachingRateLimitedAdapter(cachecontrol.CacheControlAdapter,
+                                RateLimitedAdapter):
+    """Cached responses are answered without touching the rate limits."""
+
+    def build_response(self, request, *args, **kwargs):
+        # NOTE: responses are cached, and looked up, by the URL that was
+        # asked for rather than the one it was rewritten to
+        original_url = getattr(request, 'original_url', None)
+        if original_url is not None:
+            request = request.copy()
+            request.url = original_url
+        return super(CachingRateLimitedAdapter, self).build_response(
+            request, *args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        response = super(CachingRateLimitedAdapter, self).send(
+            request, *args, **kwargs)
+        if getattr(response, 'from_cache', False):
+            self._transport.stats.count(
+                'http_cache_hits_total',
+                **_stats.request_labels(request.method, request.url))
+        return response
@@ -12,13 +12,54 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
+import time
+
 import cachecontrol
 import requests
 
 from os_trello import _utils
 
 
+DEFAULT_FULL_SYNC_INTERVAL = 24 * 60 * 60
+DEFAULT_PAGE_SIZE = 75
+# NOTE: in seconds; searches reach back a little before the last one
+# started in case our clock and Launchpad's disagree
+MODIFIED_SINCE_MARGIN = 10 * 60
+
+
+class BugCache(object):
+    """Fetch the bug behind a bug task, but only once.
+
+    Every task of a bug links to the same bug so they all share a single
+    request, even when they ask for it from different threads. Between runs
+    the HTTP cache revalidates the bug using its ETag, which changes along
+    with the bug's date_last_updated.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._bugs = _utils.FetchOnce()  # indexed by bug_link
+
+    def _fetch(self, bug_link):
+        resp = self._session.get(bug_link)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get(self, bug_link):
+        return self._bugs.get(bug_link, lambda: self._fetch(bug_link))
+
+    def clear(self):
+        """Forget the bugs so they're fetched again the next time."""
+        self._bugs.clear()
+
+
 class Bug(_utils.Entity):
+    __slots__ = ('_bug_cache',)
+
+    def __init__(self, data, session=None, bug_cache=None):
+        super(Bug, self).__init__(data, session)
+        self._bug_cache = bug_cache or BugCache(session)
 
     @property
     def number(self):
@@ -26,8 +67,9 @@ class Bug(_utils.Entity):
 
     @property
     def description(self):
-        resp = self._session.get(self._data['bug_link'])
-        return resp.json()['description']
+        # NOTE: this is only needed when a card is created so the bug is
+        # fetched on first use rather than when the task is found.
+        return self._bug_cache.get(self._data['bug_link'])['description']
 
 
 class LaunchPad(object):
@@ -37,25 +79,122 @@ class LaunchPad(object):
         https://api.launchpad.net/1.0/#person-searchTasks
     """
 
-    def __init__(self, username):
+    def __init__(self, username, session=None, page_size=DEFAULT_PAGE_SIZE,
+                 statuses=None, executor=None, bug_cache=None):
         self._user_url = 'https://api.launchpad.net/1.0/~%s' % username
-        self._session = cachecontrol.CacheControl(requests.Session())
+        self._session = (session or
+                         cachecontrol.CacheControl(requests.Session()))
+        self._bug_cache = bug_cache or BugCache(self._session)
+        self._page_size = page_size
+        self._statuses = statuses
+        self._executor = executor
+
+    def _get(self, url, params=None):
+        resp = self._session.get(url, params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _pages(self, params):
+        page = self._get(self._user_url, params)
+        yield page
 
-    def _search(self, query_name):
-        url = '{user_url}?ws.op=searchTasks&{query_name}={user_url}'.format(
-            user_url=self._user_url, query_name=query_name)
-        resp = self._session.get(url)
-        for bug_data in resp.json()['entries']:
-            yield Bug(bug_data, self._session)
+        # NOTE: when Launchpad tells us how many tasks there are the rest of
+        # the pages are all fetched concurrently; otherwise we fall back to
+        # following the links one page at a time.
+        total_size = page.get('total_size')
+        size = len(page['entries'])
+        if self._executor and total_size is not None and size:
+            pending = [
+                self._executor.submit(self._get, self._user_url,
+                                      params + [('ws.start', start)])
+                for start in range(size, total_size, size)
+            ]
+            for future in pending:
+                yield future.result()
+            return
 
-    def get_my_bugs(self):
-        return self._search('assignee')
+        while page.get('next_collection_link'):
+            page = self._get(page['next_collection_link'])
+            yield page
 
-    def get_subscribed_bugs(self):
-        return self._search('bug_subscriber')
+    def _search(self, query_name, modified_since=None):
+        params = [
+            ('ws.op', 'searchTasks'),
+            (query_name, self._user_url),
+            ('ws.size', self._page_size),
+        ]
+        for status in self._statuses or []:
+            params.append(('status', status))
+        if modified_since:
+            params.append(('modified_since', modified_since))
 
-    def get_bugs_i_commented_on(self):
-        #return self._search('bug_commenter')
+        for page in self._pages(params):
+            for bug_data in page['entries']:
+                yield Bug(bug_data, self._session, self._bug_cache)
+
+    def get_my_bugs(self, modified_since=None):
+        return self._search('assignee', modified_since)
+
+    def get_subscribed_bugs(self, modified_since=None):
+        return self._search('bug_subscriber', modified_since)
+
+    def get_bugs_i_commented_on(self, modified_since=None):
+        #return self._search('bug_commenter', modified_since)
         return []
 
+
+class IncrementalSearch(object):
+    """Run a search, only fetching the bug tasks modified since the last run.
+
+    When the last run started and the numbers of the bugs that matched are
+    kept in the state. Bugs that aren't returned by an incremental run are
+    assumed to still match the search. A full search is run every
+    ``full_sync_interval`` seconds to notice the ones that don't.
+    """
+
+    def __init__(self, search, name, state,
+                 full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL,
+                 clock=time.time):
+        self._search = search
+        self._name = name
+        self._state = state
+        self._full_sync_interval = full_sync_interval
+        self._clock = clock
+        self.unchanged_numbers = set()
+
+    def run(self):
+        """Yield the bug tasks modified since the last run.
+
+        The state and ``unchanged_numbers`` are only updated once all of
+        them have been fetched.
+        """
+        searches = self._state.setdefault('launchpad', {})
+        previous = searches.get(self._name)
+        now = self._clock()
+
+        if (not previous or
+                now - previous['full_sync'] >= self._full_sync_interval):
+            bugs = self._search()
+            seen_numbers = set()
+            full_sync = now
+        else:
+            since = datetime.datetime.utcfromtimestamp(
+                previous['started'] - MODIFIED_SINCE_MARGIN)
+            bugs = self._search(
+                modified_since=since.strftime('%Y-%m-%dT%H:%M:%S+00:00'))
+            seen_numbers = set(previous['seen'])
+            full_sync = previous['full_sync']
+
+        fetched_numbers = set()
+        for bug in bugs:
+            fetched_numbers.add(bug.number)
+            yield bug
+
+        self.unchanged_numbers = seen_numbers - fetched_numbers
+        searches[self._name] = {
+            'started': now,
+            'seen': sorted(seen_numbers | fetched_numbers),
+            'full_sync': full_sync,
+        }
+
 # TODO: maybe reporter?
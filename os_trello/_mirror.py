@@ -0,0 +1,178 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from os_trello import _utils
+
+
+logger = logging.getLogger('os_trello')
+
+DEFAULT_MIRROR_FILE = '~/.cache/os-trello/mirror.sqlite'
+ENTITY_KINDS = ('cards', 'lists', 'labels')
+# NOTE: Trello won't return more actions than this in one request; a board
+# that changed more than that is simply loaded again.
+MAX_ACTIONS = 1000
+
+
+class BoardMirror(object):
+    """A copy of Trello boards that is kept on disk between runs.
+
+    Each board remembers the id of the last action it has seen so that only
+    the actions since then need to be fetched to bring it up to date.
+    """
+
+    def __init__(self, filename):
+        filename = os.path.expanduser(filename)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS boards ('
+            '  alias TEXT PRIMARY KEY,'
+            '  id TEXT NOT NULL,'
+            '  last_action_id TEXT)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entities ('
+            '  board_id TEXT NOT NULL,'
+            '  kind TEXT NOT NULL,'
+            '  id TEXT NOT NULL,'
+            '  data TEXT NOT NULL,'
+            '  PRIMARY KEY (board_id, kind, id))')
+        self._conn.commit()
+
+    def load(self, alias):
+        """Return the mirrored snapshot for a board, if there is one.
+
+        The alias is the board id from the config file, which may be the
+        short id rather than the GUID.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, last_action_id FROM boards WHERE alias = ?',
+                (alias,)).fetchone()
+            if row is None or row[1] is None:
+                return None
+            snapshot = dict(id=row[0], last_action_id=row[1])
+            for kind in ENTITY_KINDS:
+                rows = self._conn.execute(
+                    'SELECT data FROM entities WHERE board_id = ? AND '
+                    'kind = ?', (snapshot['id'], kind))
+                snapshot[kind] = [json.loads(data) for data, in rows]
+        return snapshot
+
+    def save(self, alias, snapshot):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO boards VALUES (?, ?, ?)',
+                (alias, snapshot['id'], snapshot['last_action_id']))
+            self._conn.execute('DELETE FROM entities WHERE board_id = ?',
+                               (snapshot['id'],))
+            for kind in ENTITY_KINDS:
+                self._conn.executemany(
+                    'INSERT INTO entities VALUES (?, ?, ?, ?)',
+                    [(snapshot['id'], kind, data['id'], json.dumps(data))
+                     for data in snapshot[kind]])
+            self._conn.commit()
+
+
+def _update_card(card, data):
+    card_data = data['card']
+    for key in ('name', 'idList'):
+        if key in card_data:
+            card[key] = card_data[key]
+    if 'desc' in card_data:
+        card['descHash'] = _utils.content_hash(card_data['desc'])
+
+
+def _add_label(card, data):
+    if data['label']['id'] not in card['idLabels']:
+        card['idLabels'].append(data['label']['id'])
+
+
+def _remove_label(card, data):
+    if data['label']['id'] in card['idLabels']:
+        card['idLabels'].remove(data['label']['id'])
+
+
+_CARD_UPDATERS = {
+    'updateCard': _update_card,
+    'addLabelToCard': _add_label,
+    'removeLabelFromCard': _remove_label,
+}
+
+
+def _apply_card_action(cards, action_type, data, refetch_ids):
+    card_id = data['card']['id']
+    card = cards.get(card_id)
+
+    if (action_type in ('deleteCard', 'moveCardFromBoard') or
+            data['card'].get('closed')):
+        cards.pop(card_id, None)
+        refetch_ids.discard(card_id)
+    elif card is None:
+        # NOTE: actions don't carry all of a card's fields (a new card's
+        # labels, for instance) so cards we don't know are fetched again.
+        refetch_ids.add(card_id)
+    elif action_type in _CARD_UPDATERS:
+        _CARD_UPDATERS[action_type](card, data)
+
+
+def _apply_named_action(entities, action_type, entity_data, fields):
+    entity_id = entity_data['id']
+    if action_type.startswith('delete') or entity_data.get('closed'):
+        entities.pop(entity_id, None)
+        return
+    entity = entities.setdefault(entity_id, dict(id=entity_id))
+    for key in fields:
+        if key in entity_data:
+            entity[key] = entity_data[key]
+
+
+def apply_actions(snapshot, actions):
+    """Bring a snapshot up to date using the board's actions.
+
+    The actions are expected oldest first. Returns the ids of the cards that
+    couldn't be updated from their actions alone and need to be fetched.
+    """
+    entities = dict((kind, dict((data['id'], data)
+                                for data in snapshot[kind]))
+                    for kind in ENTITY_KINDS)
+    refetch_ids = set()
+
+    for action in actions:
+        action_type = action['type']
+        data = action.get('data', {})
+        if 'card' in data and action_type.endswith(('Card', 'CardToBoard',
+                                                    'CardFromBoard')):
+            _apply_card_action(entities['cards'], action_type, data,
+                               refetch_ids)
+        elif action_type in ('createList', 'updateList'):
+            _apply_named_action(entities['lists'], action_type,
+                                data['list'], ('name',))
+        elif action_type in ('createLabel', 'updateLabel', 'deleteLabel'):
+            _apply_named_action(entities['labels'], action_type,
+                                data['label'], ('name', 'color'))
+        snapshot['last_action_id'] = action['id']
+
+    for kind in ENTITY_KINDS:
+        snapshot[kind] = list(entities[kind].values())
+    return refetch_ids
@@ -0,0 +1,110 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+
+from concurrent import futures
+from six.moves import queue
+
+
+DEFAULT_QUEUE_SIZE = 100
+
+_DONE = object()
+
+
+class Aborted(Exception):
+    """The consumer failed so there's no point in producing any more."""
+
+
+class Pipeline(object):
+    """Consume what a number of producers find while they are still at it.
+
+    Each producer runs in a thread of its own and hands items to the
+    consumer, which runs in the calling thread, through a bounded queue. A
+    producer that gets too far ahead waits for the consumer to catch up.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        self._queue = queue.Queue(queue_size)
+        self._aborted = threading.Event()
+
+    def put(self, item):
+        """Hand an item to the consumer; blocks while the queue is full."""
+        if self._aborted.is_set():
+            raise Aborted()
+        self._queue.put(item)
+
+    def _produce(self, producer):
+        try:
+            return producer(self.put)
+        finally:
+            self._queue.put(_DONE)
+
+    def run(self, producers, consume):
+        """Consume everything the producers find and return their results.
+
+        Producers are called with the function that hands over an item. The
+        first failure of a producer is raised once all of the items have
+        been consumed; if the consumer fails the producers are stopped.
+        """
+        with futures.ThreadPoolExecutor(max_workers=len(producers)) as pool:
+            pending = [pool.submit(self._produce, producer)
+                       for producer in producers]
+            remaining = len(pending)
+            try:
+                while remaining:
+                    item = self._queue.get()
+                    if item is _DONE:
+                        remaining -= 1
+                    else:
+                        consume(item)
+            except Exception:
+                self._aborted.set()
+                # NOTE: producers blocked on a full queue need to get to
+                # the point where they notice
+                while remaining:
+                    if self._queue.get() is _DONE:
+                        remaining -= 1
+                raise
+        return [future.result() for future in pending]
+
+
+class BoundedSubmitter(object):
+    """Submit work to an executor, but only so much of it at a time.
+
+    Submitting blocks while ``limit`` submissions are still pending, which
+    keeps a fast producer of work from queueing up everything at once.
+    """
+
+    def __init__(self, executor, limit):
+        self._executor = executor
+        self._slots = threading.BoundedSemaphore(limit)
+        self._pending = []
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        self._pending.append(future)
+        return future
+
+    def wait(self):
+        """Wait for everything submitted so far; raise the first failure."""
+        pending, self._pending = self._pending, []
+        for future in futures.as_completed(pending):
+            future.result()
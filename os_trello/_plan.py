@@ -0,0 +1,310 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import logging
+
+from os_trello import _utils
+
+
+logger = logging.getLogger('os_trello')
+
+
+class CreateCard(object):
+
+    def __init__(self, analyzer):
+        self.number = analyzer.get_number()
+        self.title = analyzer.get_title()
+        self.url = analyzer.get_url()
+        self.list_name = analyzer.get_card_list_name()
+        self.label_names = analyzer.get_labels()
+        # NOTE: the description may be expensive to produce so we wait
+        # until the card is actually created.
+        self._analyzer = analyzer
+
+    def __str__(self):
+        return 'create %s %r in %r with labels %s' % (
+            self.number, self.title, self.list_name,
+            ', '.join(self.label_names))
+
+    def apply(self, trello_board, batch):
+        card_list = trello_board.lists.get(self.list_name)
+        labels = [trello_board.labels.get(n) for n in self.label_names]
+        batch.add_card(self.title, self._analyzer.get_description,
+                       self.url, card_list, labels=labels)
+
+
+class UpdateCard(object):
+
+    def __init__(self, card, analyzer, title=None, describe=False):
+        self.card = card
+        self.title = title
+        self.describe = describe
+        self._analyzer = analyzer
+
+    def __str__(self):
+        fields = []
+        if self.title is not None:
+            fields.append('title to %r' % self.title)
+        if self.describe:
+            fields.append('description')
+        return 'update %s %s' % (self.card.number, ' and '.join(fields))
+
+    def apply(self, trello_board, batch):
+        if self.title is not None:
+            batch.rename_card(self.card, self.title)
+        if self.describe:
+            batch.describe_card(self.card, self._analyzer.get_description())
+
+
+class MoveCard(object):
+
+    def __init__(self, card, list_name):
+        self.card = card
+        self.list_name = list_name
+
+    def __str__(self):
+        return 'move %s to %r' % (self.card.number, self.list_name)
+
+    def apply(self, trello_board, batch):
+        card_list = trello_board.lists.get(self.list_name)
+        batch.move_card(self.card, card_list)
+
+
+class AddLabels(object):
+
+    def __init__(self, card, label_names):
+        self.card = card
+        self.label_names = label_names
+
+    def __str__(self):
+        return 'label %s with %s' % (
+            self.card.number, ', '.join(self.label_names))
+
+    def apply(self, trello_board, batch):
+        for label_name in self.label_names:
+            batch.add_label(self.card, trello_board.labels.get(label_name))
+
+
+class DeleteCard(object):
+
+    def __init__(self, card):
+        self.card = card
+
+    def __str__(self):
+        return 'delete %s %r' % (self.card.number, self.card.name)
+
+    def apply(self, trello_board, batch):
+        logger.info('removing orphaned Trello card: %s', self.card.number)
+        batch.delete_card(self.card)
+
+
+class ArchiveCard(DeleteCard):
+
+    def __str__(self):
+        return 'archive %s %r' % (self.card.number, self.card.name)
+
+    def apply(self, trello_board, batch):
+        logger.info('archiving orphaned Trello card: %s', self.card.number)
+        batch.archive_card(self.card)
+
+
+def label_names(operations):
+    names = set()
+    for operation in operations:
+        names.update(getattr(operation, 'label_names', []))
+    return names
+
+
+class Plan(object):
+    """An ordered list of operations to apply to a Trello board.
+
+    Planning only reads from the board snapshot and the analyzers so a card
+    that is already up to date doesn't cost any requests at all.
+    """
+
+    def __init__(self):
+        self.operations = []
+        # NOTE: the fingerprints of the analyzed items and the versions of
+        # their descriptions, indexed by number
+        self.fingerprints = {}
+        self.description_versions = {}
+
+    def extend(self, operations):
+        self.operations.extend(operations)
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __iter__(self):
+        return iter(self.operations)
+
+
+def primary_card(cards):
+    """Pick the card to keep when an item has more than one.
+
+    Trello ids start with the time they were created so the oldest card
+    wins; it is the one people have had the longest to add to.
+    """
+    return min(cards, key=lambda card: card.id)
+
+
+def plan_card(trello_board, analyzer, described_version=None):
+    """Return the operations needed to sync a single analyzed item.
+
+    ``described_version`` is the version of the item whose description the
+    card is known to have, if any.
+    """
+    cards = trello_board.cards.get_all(analyzer.get_number())
+    if not cards:
+        return [CreateCard(analyzer)]
+    card = primary_card(cards)
+
+    operations = []
+
+    update = plan_update(card, analyzer, described_version)
+    if update:
+        operations.append(update)
+
+    label_names = []
+    for label_name in analyzer.get_labels():
+        label = trello_board.labels.get(label_name)
+        if not label or label.id not in card.label_ids:
+            label_names.append(label_name)
+    if label_names:
+        operations.append(AddLabels(card, label_names))
+
+    list_name = analyzer.get_card_list_name()
+    card_list = trello_board.lists.get(list_name)
+    if card_list and card.idList != card_list.id:
+        operations.append(MoveCard(card, list_name))
+
+    return operations
+
+
+def plan_update(card, analyzer, described_version=None):
+    """Return the operation that updates the card's content, if it changed.
+
+    The description can only change along with its version. A card that is
+    known to have the current version is left alone; otherwise, since cards
+    only keep a hash of their description, it is compared with the hash of
+    what the analyzer would write. An analyzer whose description version is
+    None only writes the description when the card is created.
+    """
+    title = analyzer.get_title()
+    if title == card.name:
+        title = None
+    version = analyzer.get_description_version()
+    describe = (version is not None and version != described_version and
+                analyzer.get_description_hash() !=
+                card._data.get('descHash'))
+    if title is None and not describe:
+        return None
+    return UpdateCard(card, analyzer, title, describe)
+
+
+def plan_orphans(trello_board, touched_numbers, archive=False):
+    """Return the operations that remove cards that are no longer synced.
+
+    The duplicates of a synced item's card are removed too. Cards are
+    archived rather than deleted if ``archive`` is set.
+    """
+    remove = ArchiveCard if archive else DeleteCard
+    operations = []
+    for number in trello_board.cards.keys():
+        # NOTE: a number of None is the result of adding a card by hand that
+        # doesn't conform to the naming conventions used by the Gerrit and
+        # Launchpad cards. We manually added these so we should also
+        # manually delete them.
+        if number is None:
+            continue
+        cards = trello_board.cards.get_all(number)
+        if number in touched_numbers:
+            cards.remove(primary_card(cards))
+        operations.extend(remove(card) for card in cards)
+    return operations
+
+
+def card_fingerprint(trello_board, number):
+    """Summarize the parts of a card that a sync can change.
+
+    Returns None unless the number has exactly one card.
+    """
+    cards = trello_board.cards.get_all(number)
+    if len(cards) != 1:
+        return None
+    card = cards[0]
+    return _utils.content_hash(card.name, card.idList,
+                               card._data.get('descHash'),
+                               *sorted(card.label_ids))
+
+
+class AnalysisCache(object):
+    """Remember what the synced reviews and bugs and their cards looked like.
+
+    The entries are kept in the state between runs. If nothing that an
+    item's analysis depends on has changed and nobody has touched its card
+    since the last sync then the item needs neither analysis nor changes.
+    """
+
+    def __init__(self, state):
+        self._entries = state.setdefault('analysis', {})  # indexed by number
+
+    def __len__(self):
+        return len(self._entries)
+
+    def described_version(self, number):
+        """The version of the description the item's card was synced with.
+        """
+        return self._entries.get(number, {}).get('description')
+
+    def is_unchanged(self, number, fingerprint, trello_board):
+        entry = self._entries.get(number)
+        return (entry is not None and
+                entry['fingerprint'] == fingerprint and
+                entry['card'] == card_fingerprint(trello_board, number))
+
+    def record(self, plan, trello_board, unchanged_numbers=()):
+        """Remember the items of a plan once it has been executed.
+
+        The entries of the unchanged numbers are kept even though they
+        weren't part of the plan; all of the others are forgotten.
+        """
+        entries = {}
+        for number, fingerprint in plan.fingerprints.items():
+            card = card_fingerprint(trello_board, number)
+            if card is not None:
+                entries[number] = dict(
+                    fingerprint=fingerprint, card=card,
+                    description=plan.description_versions.get(number))
+        for number in unchanged_numbers:
+            if number in self._entries:
+                entries.setdefault(number, self._entries[number])
+        self._entries.clear()
+        self._entries.update(entries)
+
+
+def submit(operations, trello_board, label_color, executor):
+    """Start applying the operations and return the futures of the writes.
+
+    Missing labels are created up front, once each. The operations are
+    then queued in a single batch so that all of the changes to a card are
+    sent to Trello together.
+    """
+    for label_name in sorted(label_names(operations)):
+        trello_board.labels.ensure_exists(label_name, label_color)
+
+    batch = trello_board.batch()
+    for operation in operations:
+        operation.apply(trello_board, batch)
+    return batch.submit(executor)
@@ -0,0 +1,61 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import threading
+
+
+DEFAULT_STATE_FILE = '~/.cache/os-trello/state.json'
+
+
+class State(object):
+    """A JSON document that is remembered between sync runs.
+
+    Nothing is written to disk until ``save`` is called so that a failed
+    run doesn't record progress it didn't make.
+    """
+
+    def __init__(self, filename):
+        self._filename = os.path.expanduser(filename)
+        self._lock = threading.Lock()
+        try:
+            with open(self._filename) as f:
+                self._data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self._data = {}
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def setdefault(self, key, default):
+        with self._lock:
+            return self._data.setdefault(key, default)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def save(self):
+        directory = os.path.dirname(self._filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = self._filename + '.tmp'
+        with self._lock:
+            with open(tmp_filename, 'w') as f:
+                json.dump(self._data, f, sort_keys=True)
+        os.rename(tmp_filename, self._filename)
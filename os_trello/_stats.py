@@ -0,0 +1,208 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import bisect
+import collections
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+from six.moves import urllib
+
+
+PREFIX = 'os_trello_'
+# NOTE: in seconds; chosen to cover everything from a cached response to a
+# large board snapshot over a slow connection
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0)
+
+# NOTE: Trello ids, Gerrit change ids, numbers and revisions, Launchpad bug
+# numbers and people; collapsing them keeps the number of endpoints small
+_ID_RE = re.compile(
+    r'/(?:[0-9a-f]{24}|I?[0-9a-f]{40}|\d{3,}|~[^/]+)(?=/|$)')
+
+
+def endpoint(path):
+    """Return the path with its ids replaced by ``{id}``."""
+    return _ID_RE.sub('/{id}', path)
+
+
+def request_labels(method, url):
+    parts = urllib.parse.urlsplit(url)
+    return dict(method=method, host=parts.hostname,
+                endpoint=endpoint(parts.path))
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Yield the upper bound of each bucket with its cumulative count."""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in labels)
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _histogram_lines(name, labels, histogram):
+    for bound, count in histogram.cumulative():
+        bucket_labels = labels + (('le', _format_bound(bound)),)
+        yield '%s_bucket%s %d' % (name, _format_labels(bucket_labels), count)
+    yield '%s_sum%s %r' % (name, _format_labels(labels), histogram.sum)
+    yield '%s_count%s %d' % (name, _format_labels(labels), histogram.count)
+
+
+def _describe(name, labels):
+    labels = dict(labels)
+    if name == 'http_request_seconds':
+        what = '%s %s%s' % (labels.pop('method'), labels.pop('host'),
+                            labels.pop('endpoint'))
+    elif name == 'sync_phase_seconds':
+        what = 'phase %s' % labels.pop('phase')
+    else:
+        what = name
+    if labels:
+        what += ' (%s)' % ', '.join('%s=%s' % item
+                                    for item in sorted(labels.items()))
+    return what
+
+
+class Registry(object):
+    """Counters and histograms for everything a sync does.
+
+    Metrics are identified by a name and a set of labels, the same way
+    Prometheus does it, so they can be exported as is.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._counters = collections.OrderedDict()
+        self._histograms = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe how many seconds the block takes, even if it fails."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self._clock() - start, **labels)
+
+    def counters(self):
+        with self._lock:
+            return list(self._counters.items())
+
+    def histograms(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+    def to_dict(self):
+        return dict(
+            counters=[dict(name=name, labels=dict(labels), value=value)
+                      for (name, labels), value in self.counters()],
+            histograms=[dict(name=name, labels=dict(labels),
+                             count=histogram.count, sum=histogram.sum,
+                             buckets=[[_format_bound(bound), count]
+                                      for bound, count
+                                      in histogram.cumulative()])
+                        for (name, labels), histogram in self.histograms()],
+        )
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Return the metrics in Prometheus' text exposition format."""
+        lines = []
+        last_name = None
+        for (name, labels), value in sorted(self.counters()):
+            if name != last_name:
+                lines.append('# TYPE %s%s counter' % (PREFIX, name))
+                last_name = name
+            lines.append('%s%s%s %s' % (PREFIX, name, _format_labels(labels),
+                                        value))
+        for (name, labels), histogram in sorted(self.histograms()):
+            if name != last_name:
+                lines.append('# TYPE %s%s histogram' % (PREFIX, name))
+                last_name = name
+            lines.extend(_histogram_lines(PREFIX + name, labels, histogram))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Return a report of the timings and request counts for people."""
+        lines = ['%-64s %8s %10s %10s' % ('', 'count', 'total (s)',
+                                          'mean (s)')]
+        for (name, labels), histogram in sorted(self.histograms()):
+            lines.append('%-64s %8d %10.3f %10.3f' % (
+                _describe(name, labels), histogram.count, histogram.sum,
+                histogram.sum / histogram.count))
+        for (name, labels), value in sorted(self.counters()):
+            # NOTE: the request timings already include their counts
+            if name != 'http_requests_total':
+                lines.append('%-64s %8d' % (_describe(name, labels), value))
+        return '\n'.join(lines)
+
+    def write(self, filename, fmt='prometheus'):
+        """Write the metrics to a file, atomically.
+
+        Prometheus' node exporter can pick up the file with its textfile
+        collector.
+        """
+        content = self.to_json() if fmt == 'json' else self.to_prometheus()
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            f.write(content)
+        os.rename(tmp_filename, filename)
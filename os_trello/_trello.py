@@ -15,14 +15,25 @@
 import collections
 import logging
 import re
+import threading
 
+from concurrent import futures
 import requests
 
+from os_trello import _mirror
 from os_trello import _utils
 
+try:
+    from ijson import common as ijson_common
+    import ijson
+except ImportError:
+    ijson = None  # cards are parsed all at once instead of streamed
+
 
 logger = logging.getLogger('os_trello')
 
+_fallback_logged = False
+
 CLIENT_NAME = 'os-trello'
 NEEDS_WORK_LIST = 'Needs Work'
 IN_PROGRESS_LIST = 'In Progress'
@@ -33,6 +44,66 @@ REVIEW_LABEL = 'review'
 CODE_LABEL = 'code'
 BUG_LABEL = 'bug'
 
+# NOTE: these are the only parts of a card the sync uses; the description
+# is replaced by its hash as soon as the card is loaded.
+CARD_FIELDS = ('id', 'name', 'idList', 'idLabels', 'descHash')
+
+GERRIT_CARD_RE = re.compile(r'^\[(\d+)\]')
+BUG_CARD_RE = re.compile(r'^Bug #(\d+)')
+
+
+def parse_card_number(name):
+    """Return the number of the review or bug a card's name refers to."""
+    match = GERRIT_CARD_RE.match(name)
+    if match:
+        return 'gerrit:' + match.group(1)
+    match = BUG_CARD_RE.match(name)
+    if match:
+        return 'lp:' + match.group(1)
+    # TODO: maybe we need to do somethings smarter?
+    # raise Exception('unmanaged card? %s' % name)
+
+
+def slim_card_data(data):
+    """Return a copy of the card's data with only the fields we need."""
+    slim = dict((k, data[k]) for k in CARD_FIELDS if k in data)
+    if 'desc' in data:
+        slim['descHash'] = _utils.content_hash(data['desc'])
+    return slim
+
+
+def _log_fallback():
+    global _fallback_logged
+    if not _fallback_logged:
+        _fallback_logged = True
+        logger.info('ijson is not installed so the board is loaded all at '
+                    'once; install os-trello[streaming] to stream it')
+
+
+def parse_snapshot(fileobj):
+    """Incrementally parse a board snapshot.
+
+    Each card is slimmed down as soon as it has been parsed so the full
+    card data for the whole board is never held in memory at once.
+    """
+    snapshot_builder = ijson_common.ObjectBuilder()
+    card_builder = None
+    cards = []
+    for prefix, event, value in ijson.parse(fileobj):
+        if prefix == 'cards.item' and event == 'start_map':
+            card_builder = ijson_common.ObjectBuilder()
+        if card_builder is None:
+            snapshot_builder.event(event, value)
+            continue
+        card_builder.event(event, value)
+        if prefix == 'cards.item' and event == 'end_map':
+            cards.append(slim_card_data(card_builder.value))
+            card_builder = None
+
+    snapshot = snapshot_builder.value
+    snapshot['cards'] = cards
+    return snapshot
+
 
 class DuplicateCard(Exception):
 
@@ -42,40 +113,72 @@ class DuplicateCard(Exception):
 
 
 class CardEntity(_utils.Entity):
+    __slots__ = ('number', '_collection')
     base_url = 'https://trello.com/1/cards'
 
-    @property
-    def number(self):
-        # TODO: move me
-        match = re.match(r'^\[(\d+)\].*', self._data['name'])
-        if match:
-            return 'gerrit:' + match.groups()[0]
-        match = re.match(r'^Bug #(\d+).*', self._data['name'])
-        if match:
-            return 'lp:' + match.groups()[0]
-        # TODO: maybe we need to do somethings smarter?
-        # raise Exception('unmanaged card? %s' % self._data['name'])
+    def __init__(self, data, session=None):
+        super(CardEntity, self).__init__(slim_card_data(data), session)
+        # NOTE: the number is parsed once up front because it is what the
+        # cards are indexed by.
+        self.number = parse_card_number(data['name'])
+        self._collection = None
 
     @property
     def label_ids(self):
-        url = _utils.urljoin(self.base_url, self.id, 'idLabels')
-        resp = self._session.get(url)
-        resp.raise_for_status()
-        return resp.json()
+        # NOTE: idLabels comes along with the board snapshot and is kept up
+        # to date locally by add_label so there is no need to ask Trello.
+        return self._data.setdefault('idLabels', [])
+
+    def _changed(self, **fields):
+        """Record changes that were made in Trello locally."""
+        fields = slim_card_data(fields)
+        if self._collection is not None:
+            self._collection._reindex(self, fields)
+        else:
+            self._data.update(fields)
+            self.number = parse_card_number(self._data['name'])
+
+    def _removed(self, resp):
+        """Forget a card that is no longer on the board."""
+        # NOTE: a card that's already gone is as good as removed
+        if resp.status_code != 404:
+            resp.raise_for_status()
+        if self._collection is not None:
+            self._collection._remove_entity(self)
 
     def delete(self):
         logger.info('deleting card %r', self.name)
-        self._session.delete(_utils.urljoin(self.base_url, self.id))
-        # TODO: maybe remove from the collection?
+        self._removed(
+            self._session.delete(_utils.urljoin(self.base_url, self.id)))
+
+    def archive(self):
+        """Close the card; unlike deleting it, this can be undone."""
+        logger.info('archiving card %r', self.name)
+        self._removed(
+            self._session.put(_utils.urljoin(self.base_url, self.id),
+                              data=dict(closed='true')))
 
     def add_label(self, label):
         url = _utils.urljoin(self.base_url, self.id, 'idLabels')
         if label.id not in self.label_ids:
             resp = self._session.post(url, data=dict(value=label.id))
             resp.raise_for_status()
+            self._changed(idLabels=self.label_ids + [label.id])
+
+    def update(self, **fields):
+        """Change any number of the card's fields in a single request."""
+        logger.info('updating card %r: %s', self.name, ', '.join(fields))
+        data = dict(fields)
+        if 'idLabels' in data:
+            data['idLabels'] = ','.join(data['idLabels'])
+        resp = self._session.put(_utils.urljoin(self.base_url, self.id),
+                                 data=data)
+        resp.raise_for_status()
+        self._changed(**fields)
 
 
 class LabelEntity(_utils.Entity):
+    __slots__ = ()
     base_url = 'https://trello.com/1/labels'
 
     def delete(self):
@@ -85,6 +188,7 @@ class LabelEntity(_utils.Entity):
 
 
 class ListEntity(_utils.Entity):
+    __slots__ = ()
 
     def __contains__(self, card):
         return card.idList == self.id
@@ -101,6 +205,9 @@ class EagerCollection(object):
         self._loaded = False
         self._data = {}  # indexed by name
         self._index = collections.defaultdict(list)
+        # NOTE: collections are shared by all of the sync workers so loading
+        # and adding entities must be serialized.
+        self._lock = threading.RLock()
 
     def _add_entity(self, entity):
         indexed_value = getattr(entity, self.indexed_property)
@@ -110,25 +217,48 @@ class EagerCollection(object):
         ##    #     entity.delete()
         #    raise DuplicateCard(indexed_value)
 
-        self._data[entity.id] = entity
-        self._index[indexed_value].append(entity)
+        with self._lock:
+            self._data[entity.id] = entity
+            self._index[indexed_value].append(entity)
         return entity
 
+    def _remove_entity(self, entity):
+        indexed_value = getattr(entity, self.indexed_property)
+        with self._lock:
+            self._data.pop(entity.id, None)
+            entities = self._index.get(indexed_value, [])
+            if entity in entities:
+                entities.remove(entity)
+            if not entities:
+                self._index.pop(indexed_value, None)
+
     def _load_if_needed(self):
         if self._loaded:
             return
 
-        resp = self._session.get(self._base_url)
-        resp.raise_for_status()
-        for data in resp.json():
-            entity = self.entity_class(data, self._session)
-            self._add_entity(entity)
+        with self._lock:
+            if self._loaded:
+                return  # another worker beat us to it
+
+            resp = self._session.get(self._base_url)
+            resp.raise_for_status()
+            self.load(resp.json())
 
-        self._loaded = True
+    def load(self, entities_data):
+        """Populate the collection from already fetched entity data."""
+        with self._lock:
+            for data in entities_data:
+                entity = self.entity_class(data, self._session)
+                self._add_entity(entity)
 
+            self._loaded = True
+
+    # NOTE: the workers writing cards reindex them as they go, so reads
+    # take the lock too rather than catching a card between indexes
     def get(self, name, default=None):
         self._load_if_needed()
-        entities = self._index[name]
+        with self._lock:
+            entities = list(self._index.get(name, []))
         if len(entities) == 0:
             return default
         elif len(entities) > 1:
@@ -137,21 +267,49 @@ class EagerCollection(object):
 
     def get_all(self, name):
         self._load_if_needed()
-        return self._index[name]
+        with self._lock:
+            return list(self._index.get(name, []))
+
+    def keys(self):
+        """Return all of the indexed values."""
+        self._load_if_needed()
+        with self._lock:
+            return list(self._index)
 
     def __len__(self):
         self._load_if_needed()
         return len(self._data)
 
     def __iter__(self):
-        for entity in self._data.values():
+        with self._lock:
+            entities = list(self._data.values())
+        for entity in entities:
             yield entity
 
 
 class CardCollection(EagerCollection):
+    """The board's cards, indexed by number."""
     entity_class = CardEntity
     indexed_property = 'number'
 
+    def _add_entity(self, entity):
+        with self._lock:
+            super(CardCollection, self)._add_entity(entity)
+            entity._collection = self
+        return entity
+
+    def _remove_entity(self, entity):
+        with self._lock:
+            super(CardCollection, self)._remove_entity(entity)
+            entity._collection = None
+
+    def _reindex(self, entity, fields):
+        with self._lock:
+            self._remove_entity(entity)
+            entity._data.update(fields)
+            entity.number = parse_card_number(entity._data['name'])
+            self._add_entity(entity)
+
     def add(self, name, description, source_url, card_list, labels=None):
         logger.info('creating card %r', name)
         card_list_id = card_list.id if card_list else None
@@ -174,7 +332,8 @@ class LabelCollection(EagerCollection):
         return self._add_entity(LabelEntity(resp.json()))
 
     def ensure_exists(self, name, color):
-        return self.get(name) or self.add(name, color)
+        with self._lock:
+            return self.get(name) or self.add(name, color)
 
 
 class ListCollection(EagerCollection):
@@ -188,21 +347,139 @@ class ListCollection(EagerCollection):
         return self._add_entity(self.entity_class(resp.json()))
 
     def ensure_exists(self, name):
-        return self.get(name) or self.add(name)
+        with self._lock:
+            return self.get(name) or self.add(name)
         card_list = self.get(name)
         if not card_list:
             card_list = self.add(name)
         return card_list
 
 
+class WriteBatch(object):
+    """Queue up writes to the board's cards and send them all at once.
+
+    All of the changes queued for an existing card are merged into a single
+    ``PUT /1/cards/{id}``. Trello's batch API only accepts GETs so creates
+    and removals are still one request each, but they are all sent
+    concurrently when the batch is flushed.
+    """
+
+    def __init__(self, trello_board):
+        self._trello_board = trello_board
+        self._creates = []
+        self._updates = collections.OrderedDict()  # indexed by card id
+        self._removals = collections.OrderedDict()  # indexed by card id
+
+    def __len__(self):
+        return len(self._creates) + len(self._updates) + len(self._removals)
+
+    def _update(self, card, **fields):
+        card, pending = self._updates.setdefault(card.id, (card, {}))
+        pending.update(fields)
+        return pending
+
+    def add_card(self, name, description, source_url, card_list,
+                 labels=None):
+        """Queue a new card.
+
+        The description may be a callable, in which case it is only called
+        when the batch is flushed.
+        """
+        self._creates.append(
+            (name, description, source_url, card_list, labels))
+
+    def rename_card(self, card, name):
+        if card.name != name:
+            self._update(card, name=name)
+
+    def describe_card(self, card, description):
+        if card._data.get('descHash') != _utils.content_hash(description):
+            self._update(card, desc=description)
+
+    def move_card(self, card, card_list):
+        if card.idList != card_list.id:
+            self._update(card, idList=card_list.id)
+
+    def add_label(self, card, label):
+        pending = self._update(card)
+        label_ids = pending.setdefault('idLabels', list(card.label_ids))
+        if label.id not in label_ids:
+            label_ids.append(label.id)
+        if label_ids == card.label_ids:
+            del pending['idLabels']
+
+    def delete_card(self, card):
+        self._updates.pop(card.id, None)
+        self._removals[card.id] = card.delete
+
+    def archive_card(self, card):
+        self._updates.pop(card.id, None)
+        self._removals[card.id] = card.archive
+
+    def _create(self, name, description, source_url, card_list, labels):
+        if callable(description):
+            description = description()
+        return self._trello_board.cards.add(
+            name, description, source_url, card_list, labels=labels)
+
+    def flush(self, executor):
+        """Send all of the queued writes using the executor's workers."""
+        for future in futures.as_completed(self.submit(executor)):
+            future.result()
+
+    def submit(self, executor):
+        """Start sending the queued writes and return their futures."""
+        pending = []
+        for args in self._creates:
+            pending.append(executor.submit(self._create, *args))
+        for card, fields in self._updates.values():
+            if fields:
+                pending.append(executor.submit(card.update, **fields))
+        for remove in self._removals.values():
+            pending.append(executor.submit(remove))
+
+        self._creates = []
+        self._updates.clear()
+        self._removals.clear()
+        return pending
+
+
 class TrelloBoard(object):
     base_url = 'https://trello.com'
 
-    def __init__(self, key, token, board_id):
-        self._session = requests.Session()
+    # NOTE: these are the nested resources that make up the board snapshot.
+    # Only the fields that os-trello actually uses are requested.
+    snapshot_params = {
+        'fields': 'name',
+        'cards': 'open',
+        'card_fields': 'name,desc,idList,idLabels',
+        'lists': 'open',
+        'list_fields': 'name',
+        'labels': 'all',
+        'label_fields': 'name,color',
+        'labels_limit': 1000,
+        # the latest action tells a mirror where to pick up from
+        'actions': 'all',
+        'actions_limit': 1,
+        'action_fields': 'id',
+    }
+
+    def __init__(self, key, token, board_id, session=None, mirror=None):
+        self._session = session or requests.Session()
         self._session.params = {'key': key, 'token': token}
+        self._alias = board_id
+        self._mirror = mirror
 
-        board_id = self._get_real_board_id(board_id)
+        snapshot = None
+        if mirror is not None:
+            snapshot = self._get_mirrored_snapshot()
+        if snapshot is None:
+            snapshot = self._get_snapshot(board_id)
+        self._load(snapshot)
+
+    def _load(self, snapshot):
+        self.id = board_id = snapshot['id']
+        self._last_action_id = snapshot['last_action_id']
 
         self.labels = LabelCollection(self._session, _utils.urljoin(
             self.base_url, '/1/boards/%s/labels/' % board_id), board_id)
@@ -211,17 +488,112 @@ class TrelloBoard(object):
         self.cards = CardCollection(self._session, _utils.urljoin(
             self.base_url, '/1/boards/%s/cards/' % board_id), board_id)
 
-    def _get_real_board_id(self, board_id):
-        """Return the real board_id for the configured board_id.
+        self.labels.load(snapshot['labels'])
+        self.lists.load(snapshot['lists'])
+        self.cards.load(snapshot['cards'])
+
+    def _snapshot(self):
+        """Return a copy of the board as it is now."""
+        return dict(
+            id=self.id,
+            last_action_id=self._last_action_id,
+            cards=[dict(card._data, idLabels=list(card.label_ids))
+                   for card in self.cards],
+            lists=[dict(card_list._data) for card_list in self.lists],
+            labels=[dict(label._data) for label in self.labels],
+        )
+
+    def refresh(self):
+        """Bring the board up to date with the changes made since it loaded.
+
+        Only the actions since then are fetched unless there are too many of
+        them, in which case the whole board is loaded again.
+        """
+        snapshot = self._snapshot()
+        if not self._catch_up(snapshot):
+            snapshot = self._get_snapshot(self.id)
+        if snapshot['last_action_id'] != self._last_action_id:
+            self._load(snapshot)
+
+    def _get_snapshot(self, board_id):
+        """Return the board along with all of its labels, lists and cards.
 
         The config file can either have the GUID or the short id
-        (the one found in the URL of the browser). This will look
-        up the actual GUID because that is what most of the API
-        calls require.
+        (the one found in the URL of the browser). The snapshot contains
+        the actual GUID because that is what most of the API calls require.
+        """
+        resp = self._session.get(self.base_url + '/1/boards/%s' % board_id,
+                                 params=self.snapshot_params,
+                                 stream=ijson is not None)
+        resp.raise_for_status()
+        if ijson is None:
+            _log_fallback()
+            snapshot = resp.json()
+            snapshot['cards'] = [slim_card_data(d) for d in snapshot['cards']]
+        else:
+            resp.raw.decode_content = True
+            try:
+                snapshot = parse_snapshot(resp.raw)
+            finally:
+                resp.close()
+
+        actions = snapshot.pop('actions', None)
+        snapshot['last_action_id'] = actions[0]['id'] if actions else None
+        return snapshot
+
+    def _get_mirrored_snapshot(self):
+        """Return the mirrored snapshot updated with the latest actions.
+
+        None is returned when the board isn't mirrored yet or has changed
+        too much to catch up on.
+        """
+        snapshot = self._mirror.load(self._alias)
+        if snapshot is None or not self._catch_up(snapshot):
+            return None
+        return snapshot
+
+    def _catch_up(self, snapshot):
+        """Apply the actions taken since the snapshot to it.
+
+        False is returned when there are too many actions to catch up on.
         """
-        resp = self._session.get(self.base_url + '/1/boards/%s' % board_id)
+        url = self.base_url + '/1/boards/%s/actions' % snapshot['id']
+        params = dict(since=snapshot['last_action_id'], fields='type,data',
+                      limit=_mirror.MAX_ACTIONS)
+        resp = self._session.get(url, params=params)
+        resp.raise_for_status()
+        actions = resp.json()
+        if len(actions) >= _mirror.MAX_ACTIONS:
+            logger.info('too many changes to the board; reloading')
+            return False
+
+        # NOTE: Trello returns the newest actions first
+        refetch_ids = _mirror.apply_actions(snapshot, reversed(actions))
+        logger.info('applied %d actions to the board; fetching %d cards',
+                    len(actions), len(refetch_ids))
+        for card_id in refetch_ids:
+            card_data = self._get_card(card_id)
+            if card_data and not card_data.get('closed'):
+                snapshot['cards'].append(slim_card_data(card_data))
+        return True
+
+    def _get_card(self, card_id):
+        url = _utils.urljoin(CardEntity.base_url, card_id)
+        resp = self._session.get(url, params=dict(
+            fields='name,desc,idList,idLabels,closed'))
+        if resp.status_code == 404:
+            return None  # it was deleted since the action
         resp.raise_for_status()
-        return resp.json()['id']
+        return resp.json()
+
+    def save_mirror(self):
+        """Remember the board as it is now for the next run."""
+        if self._mirror is None:
+            return
+        # NOTE: any changes we made are after the last action we saw so
+        # they will be replayed next time; that is harmless because applying
+        # an action twice has the same result as applying it once.
+        self._mirror.save(self._alias, self._snapshot())
 
     def __len__(self):
         return len(self.cards)
@@ -229,6 +601,10 @@ class TrelloBoard(object):
     def __iter__(self):
         return iter(self.cards)
 
+    def batch(self):
+        """Return a new batch that will write to this board when flushed."""
+        return WriteBatch(self)
+
     def create_card(self, name, description, source_url, card_list,
                     label_names=None):
         logger.info('creating card %r', name)
@@ -244,4 +620,6 @@ class TrelloBoard(object):
         logger.info('moving %r to %r', card, card_list)
         if card.idList != card_list.id:
             url = _utils.urljoin(CardEntity.base_url, card.id, 'idList')
-            self._session.put(url, data=dict(value=card_list.id))
+            resp = self._session.put(url, data=dict(value=card_list.id))
+            resp.raise_for_status()
+            card._changed(idList=card_list.id)
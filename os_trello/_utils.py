@@ -12,8 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import hashlib
+import threading
 import weakref
 
+import six
 from six.moves import urllib
 
 
@@ -44,6 +47,41 @@ class memoized_property(property):
         return self._cache[obj]
 
 
+def content_hash(*values):
+    """Return a short hash that changes when any of the values do."""
+    digest = hashlib.sha1()
+    for value in values:
+        digest.update(six.text_type(value).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+class FetchOnce(object):
+    """Remember what was fetched for each key so it's only fetched once.
+
+    Threads that ask for the same key at the same time wait for the first
+    one to fetch it rather than fetching it again themselves.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._locks = {}  # indexed by key
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._results:
+                self._results[key] = fetch()
+        return self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._locks.clear()
+
+
 def urljoin(base, *parts):
     for part in parts:
         base = urllib.parse.urljoin(base + '/', part)
@@ -51,12 +89,18 @@ def urljoin(base, *parts):
 
 
 class Entity(object):
+    # NOTE: a board can have thousands of cards so entities don't get a
+    # __dict__; subclasses need to declare their own __slots__.
+    __slots__ = ('_data', '_session', '__weakref__')
 
     def __init__(self, data, session=None):
         self._data = data
         self._session = session
 
     def __getattr__(self, name):
+        if name.startswith('_'):
+            # NOTE: an unset slot; looking in _data could recurse forever
+            raise AttributeError(name)
         try:
             return self._data[name]
         except KeyError:
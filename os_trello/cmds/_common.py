@@ -13,29 +13,48 @@
 # under the License.
 
 import argparse
-import logging.config
+import logging
 import os
 
 from os_trello import _config
+from os_trello import _utils
 
 
 DEFAULT_CONFIG_FILE = '~/.config/os-trello/os-trello.yaml'
+CONFIG_CACHE_DIR = '~/.cache/os-trello'
 
 
-def _cli():
+def build_parser():
+    """Return the argument parser shared by all of the commands."""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '--config', action='store', default=DEFAULT_CONFIG_FILE,
         help='config file (defaults to: %s)' % DEFAULT_CONFIG_FILE)
-    return parser.parse_args()
+    parser.add_argument(
+        '--config-cache', action='store',
+        help='where the parsed config file is cached (defaults to a file '
+             'in %s)' % CONFIG_CACHE_DIR)
+    return parser
+
+
+def config_cache_file(filename):
+    """Return the default cache file for a config file."""
+    return os.path.join(os.path.expanduser(CONFIG_CACHE_DIR),
+                        'config-%s.pickle' % _utils.content_hash(
+                            os.path.abspath(filename)))
 
 
-def init_app():
-    args = _cli()
-    config = _config.Config(os.path.expanduser(args.config))
+def init_app(args=None):
+    if args is None:
+        args = build_parser().parse_args()
+    filename = os.path.expanduser(args.config)
+    config = _config.Config(filename, (args.config_cache or
+                                       config_cache_file(filename)))
 
     logging.basicConfig()
     if config.get('logging'):
-        logging.config.dictConfig(config['logging'])
+        # NOTE: only needed for custom logging, so it's imported here
+        from logging import config as logging_config
+        logging_config.dictConfig(config['logging'])
 
     return config
@@ -0,0 +1,248 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+import yaml
+
+from os_trello import _fakes
+from os_trello.cmds import sync
+
+try:
+    import resource
+except ImportError:
+    resource = None  # peak memory isn't reported
+
+# NOTE: what os-trello-sync does before it makes its first request
+STARTUP_CODE = ('import sys\n'
+                'from os_trello.cmds import sync\n'
+                'sync._common.init_app('
+                'sync._common.build_parser().parse_args(sys.argv[1:]))\n')
+# NOTE: the same, but importing the service clients up front the way
+# os-trello-sync used to, for a baseline
+EAGER_STARTUP_CODE = ('from os_trello import _gerrit, _http, _launchpad, '
+                      '_mirror, _trello\n' + STARTUP_CODE)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Time os-trello-sync against local stand-ins for '
+                    'Trello, Gerrit and Launchpad.')
+    parser.add_argument('--cards', type=int, default=10000,
+                        help='cards on the board (default: %(default)s)')
+    parser.add_argument('--reviews', type=int, default=2000,
+                        help='reviews in Gerrit (default: %(default)s)')
+    parser.add_argument('--bugs', type=int, default=500,
+                        help='bug tasks in Launchpad (default: %(default)s)')
+    parser.add_argument('--churn', type=float, default=0.05,
+                        help='fraction of the reviews and bugs whose card '
+                             'needs to change (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every request '
+                             '(default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=2,
+                        help='syncs to run one after the other; later runs '
+                             'use what the earlier ones left behind '
+                             '(default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=sync.DEFAULT_WORKERS,
+                        help='sync.workers for the runs '
+                             '(default: %(default)s)')
+    parser.add_argument('--fixtures',
+                        help='replay recorded fixtures from this JSON file '
+                             'instead of generating them')
+    parser.add_argument('--save-fixtures',
+                        help='write the fixtures to this JSON file')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    parser.add_argument('--startup', type=int, metavar='RUNS',
+                        help='time starting os-trello-sync this many times, '
+                             'with and without a cached config and with the '
+                             'service clients imported up front or when '
+                             'needed, instead of syncing')
+    return parser
+
+
+def start_services(args):
+    """Serve the fixtures from another process and return it and its hosts.
+
+    The fixtures live in the other process so that they don't count towards
+    the sync's memory use.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_fakes.serve, args=(queue,),
+        kwargs=dict(fixtures_file=args.fixtures,
+                    save_fixtures=args.save_fixtures, latency=args.latency,
+                    cards=args.cards, reviews=args.reviews, bugs=args.bugs,
+                    churn=args.churn))
+    process.daemon = True
+    process.start()
+    return process, queue.get()
+
+
+def write_config(directory, hosts, workers):
+    config = {
+        'trello': {
+            'key': 'key',
+            'token': 'token',
+            'board_id': _fakes.BOARD_ALIAS,
+            'mirror': os.path.join(directory, 'mirror.sqlite'),
+            'label_colors': {'project': 'black'},
+        },
+        'gerrit': {
+            'base_url': 'https://%s' % _fakes.GERRIT_HOST,
+            'username': 'benchmark',
+            'password': 'password',
+            'queries': ['is:starred', 'owner:self is:open'],
+            'incremental': True,
+        },
+        'launchpad': {'username': 'benchmark'},
+        'http': {
+            'hosts': hosts,
+            'cache': {'file': os.path.join(directory, 'http-cache.sqlite')},
+        },
+        'sync': {
+            'workers': workers,
+            'state_file': os.path.join(directory, 'state.json'),
+            'skip_unchanged': True,
+        },
+    }
+    filename = os.path.join(directory, 'os-trello.yaml')
+    with open(filename, 'w') as f:
+        yaml.safe_dump(config, f, default_flow_style=False)
+    return filename
+
+
+def peak_memory():
+    """The most memory this process has used so far, in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # NOTE: Linux reports kilobytes and OS X reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def request_counts(hosts):
+    stats_url = hosts[_fakes.TRELLO_HOST] + '/_stats'
+    counts = requests.get(stats_url).json()
+    # NOTE: don't count our own request for the counts
+    counts.pop('trello GET /_stats', None)
+    return counts
+
+
+def run(config_file, hosts):
+    before = request_counts(hosts)
+    start = time.time()
+    sync.main(['--config', config_file])
+    wall_time = time.time() - start
+    after = request_counts(hosts)
+
+    requests_by_endpoint = dict(
+        (endpoint, count - before.get(endpoint, 0))
+        for endpoint, count in after.items()
+        if count != before.get(endpoint, 0))
+    return dict(wall_time=wall_time, requests=requests_by_endpoint,
+                peak_memory=peak_memory())
+
+
+def time_startup(config_file, cache_file, runs, cold, deferred=True):
+    """Time starting a fresh interpreter up to the point of syncing.
+
+    A cold start has to parse the config file; a warm one finds it cached.
+    Unless ``deferred`` is set the service clients are imported up front,
+    which is what the deferred imports are measured against.
+    """
+    code = STARTUP_CODE if deferred else EAGER_STARTUP_CODE
+    command = [sys.executable, '-c', code,
+               '--config', config_file, '--config-cache', cache_file]
+    subprocess.check_call(command)  # NOTE: warms up the page cache, too
+    wall_times = []
+    for _ in range(runs):
+        if cold and os.path.exists(cache_file):
+            os.remove(cache_file)
+        start = time.time()
+        subprocess.check_call(command)
+        wall_times.append(time.time() - start)
+    return dict(cold=cold, deferred=deferred, runs=runs,
+                mean=sum(wall_times) / runs, best=min(wall_times))
+
+
+def print_startup_report(results):
+    for result in results:
+        print('%s start, %s imports: %.1fms mean, %.1fms best over %d '
+              'runs' % ('cold' if result['cold'] else 'warm',
+                        'deferred' if result['deferred'] else 'eager',
+                        result['mean'] * 1000, result['best'] * 1000,
+                        result['runs']))
+
+
+def startup(args):
+    directory = tempfile.mkdtemp(prefix='os-trello-benchmark-')
+    try:
+        config_file = write_config(directory, {}, args.workers)
+        cache_file = os.path.join(directory, 'config.pickle')
+        results = [time_startup(config_file, cache_file, args.startup, cold,
+                                deferred)
+                   for deferred in (False, True) for cold in (True, False)]
+    finally:
+        shutil.rmtree(directory)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print_startup_report(results)
+    return 0
+
+
+def print_report(results):
+    for i, result in enumerate(results, 1):
+        requests_by_endpoint = result['requests']
+        print('run %d: %.2fs, %d requests' % (
+            i, result['wall_time'], sum(requests_by_endpoint.values())))
+        if result['peak_memory'] is not None:
+            print('  peak memory: %.1f MiB' % (
+                result['peak_memory'] / 1024.0 / 1024.0))
+        for endpoint in sorted(requests_by_endpoint):
+            print('  %6d  %s' % (requests_by_endpoint[endpoint], endpoint))
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.startup:
+        return startup(args)
+
+    process, hosts = start_services(args)
+    directory = tempfile.mkdtemp(prefix='os-trello-benchmark-')
+    try:
+        config_file = write_config(directory, hosts, args.workers)
+        results = [run(config_file, hosts) for _ in range(args.runs)]
+    finally:
+        process.terminate()
+        shutil.rmtree(directory)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print_report(results)
+    return 0
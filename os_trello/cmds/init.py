@@ -13,14 +13,9 @@
 # under the License.
 
 from __future__ import print_function
-import logging
 import webbrowser
 
-import requests
-import requests_oauthlib
-
-from os_trello import _common
-from os_trello import _trello
+from os_trello.cmds import _common
 
 
 try:
@@ -30,6 +25,9 @@ except NameError:
 
 
 def create_lists(trello_board):
+    # NOTE: the Trello client pulls in requests, which is slow to import
+    from os_trello import _trello
+
     trello_board.lists.ensure_exists(_trello.DONE_LIST)
     trello_board.lists.ensure_exists(_trello.GATING_LIST)
     trello_board.lists.ensure_exists(_trello.COMPLETED_LIST)
@@ -38,6 +36,8 @@ def create_lists(trello_board):
 
 
 def create_labels(trello_board, config):
+    from os_trello import _trello
+
     label_names = (_trello.REVIEW_LABEL, _trello.CODE_LABEL, _trello.BUG_LABEL)
     for label_name in label_names:
         trello_board.labels.ensure_exists(
@@ -54,9 +54,14 @@ def authorize(config):
     print()
     secret = input('Paste your Trello API secret: ')
 
+    # NOTE: OAuth is only needed the one time a token is created
+    import requests
+    import requests_oauthlib
+
+    from os_trello import _trello
+
     key = config['trello.key']
     url = 'https://trello.com/1/authorize'
-    auth = requests_oauthlib.OAuth1(key, secret)
     r = requests.Request(
         'GET', url, auth=requests_oauthlib.OAuth1(key, secret), params={
             'key': key,
@@ -72,6 +77,8 @@ def authorize(config):
 
 
 def main():
+    from os_trello import _trello
+
     config = _common.init_app()
 
     if not config.get('trello.token'):
@@ -12,17 +12,36 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from __future__ import print_function
+import collections
+import functools
+import json
 import logging
+import os
 import re
+import sys
+import threading
 
-from os_trello import _gerrit
-from os_trello import _launchpad
-from os_trello import _trello
+from concurrent import futures
+
+from os_trello import _pipeline
+from os_trello import _plan
+from os_trello import _state
+from os_trello import _stats
+from os_trello import _utils
 from os_trello.cmds import _common
 
 
 logger = logging.getLogger('os_trello')
 
+DEFAULT_WORKERS = 4
+DEFAULT_GERRIT_INTERVAL = 300
+DEFAULT_LAUNCHPAD_INTERVAL = 900
+DEFAULT_TRELLO_INTERVAL = 300
+DEFAULT_EVENT_DELAY = 10
+
+_print_lock = threading.Lock()
+
 
 class Status:
     NEEDS_WORK = object()
@@ -35,12 +54,12 @@ class Status:
 
 class ReviewAnalyzer(object):
 
-    def __init__(self, review, username):
+    def __init__(self, review, account_id):
         self._review = review
-        self._username = username
+        self._account_id = account_id
 
     def _i_am_an_author(self):
-        if self._review._data['owner']['username'] == self._username:
+        if self._review.owner_account_id == self._account_id:
             return True
         # TODO: if i have submitted a review or am listed as the co-author
         return False
@@ -57,7 +76,17 @@ class ReviewAnalyzer(object):
         # link to another card.
         return re.sub(r'#([\d]+)', r'\1', msg)
 
+    def get_description_version(self):
+        return self._review.current_revision
+
+    def get_description_hash(self):
+        return _utils.content_hash(self.get_description())
+
     def get_labels(self):
+        # NOTE: the service clients pull in requests and friends, which are
+        # slow to import, so they are only imported once they are used
+        from os_trello import _trello
+
         if self._i_am_an_author():
             labels = [_trello.CODE_LABEL]
         else:
@@ -68,6 +97,8 @@ class ReviewAnalyzer(object):
     def get_card_list_name(self):
         # TODO: use the date to move something back to NEEDS_WORK_LIST
         # if it hasn't had a lot of movement.
+        from os_trello import _trello
+
         review_status = self._get_status()
         if review_status == Status.DONE:
             return _trello.DONE_LIST
@@ -81,6 +112,14 @@ class ReviewAnalyzer(object):
     def get_url(self):
         return self._review.url
 
+    def get_fingerprint(self):
+        """Summarize everything the analysis of the review depends on."""
+        return _utils.content_hash(
+            self._account_id, self._review.current_revision,
+            self._review.status, self._review.subject, self._review.project,
+            self._review.owner_account_id,
+            json.dumps(self._review.labels, sort_keys=True))
+
     def _get_status(self):
         def is_gating(label_data):
             if 'approved' in label_data['Workflow']:
@@ -89,7 +128,7 @@ class ReviewAnalyzer(object):
 
         def ive_voted(label_data):
             for label in label_data['Code-Review']['all']:
-                if (label.get('username') == self._username
+                if (label.get('_account_id') == self._account_id
                         and label['value'] != 0):
                     return True
             return False
@@ -119,7 +158,14 @@ class BugAnalizer(object):
     def get_description(self):
         return self._bug.description
 
+    def get_description_version(self):
+        # NOTE: the bug would have to be fetched for every task just to
+        # compare; its description is only written when the card is created
+        return None
+
     def get_labels(self):
+        from os_trello import _trello
+
         return [_trello.BUG_LABEL, self._bug._data['target_link'].rsplit('/')[-1]]
         raise Exception
         if self._i_am_an_author():
@@ -130,6 +176,8 @@ class BugAnalizer(object):
     def get_card_list_name(self):
         # TODO: this will probably need to be expanded once I figure out a
         # good bug workflow
+        from os_trello import _trello
+
         if self._bug.status in ('Fix Committed', 'Fix Released'):
             # TODO: will one of these trigger the bug to not show up in the
             # query?
@@ -145,113 +193,580 @@ class BugAnalizer(object):
     def get_url(self):
         return self._bug.web_link
 
+    def get_fingerprint(self):
+        """Summarize everything the analysis of the bug task depends on."""
+        return _utils.content_hash(self._bug.title, self._bug.status,
+                                   self._bug._data['target_link'])
 
-def create_a_card(trello_board, analyzer, config):
-    list_name = analyzer.get_card_list_name()
-    card_list = trello_board.lists.get(list_name)
-
-    label_names = analyzer.get_labels()
-    for label_name in label_names:
-        if not trello_board.labels.get(label_name):
-            trello_board.labels.add(
-                label_name, config.get('trello.label_colors.project'))
-
-    labels = [trello_board.labels.get(name) for name in label_names]
-    trello_board.cards.add(
-#    trello_board.create_card(
-        analyzer.get_title(), analyzer.get_description(),
-        analyzer.get_url(), card_list, labels=labels)
-
-
-def apply_labels_to_card(trello_board, card, label_names, config):
-    for label_name in label_names:
-        label = trello_board.labels.get(label_name)
-        if not label:
-            label = trello_board.labels.add(
-                label_name, config.get('trello.label_colors.project'))
-
-        card.add_label(label)
-
-
-def move_existing_card_to_list(trello_board, card, list_name):
-    card_list = trello_board.lists.get(list_name)
-    trello_board.move_card(card, card_list)
 
+def run_queries(config, gerrit, found, state=None):
+    """Run the queries and return the numbers of the changes they matched.
 
-def sync_thing(analyzer, trello_board, config):
-    logger.info('syncing %s', analyzer.get_number())
+    The queries run concurrently and ``found`` is called with each review
+    as soon as its page arrives, so that only a page per query is held in
+    memory. A change matched by more than one query is found once for each
+    of them. The numbers of the unchanged changes are returned too; without
+    a state every query is run in full and nothing is unchanged.
+    """
+    from os_trello import _gerrit
 
-    card = trello_board.cards.get(analyzer.get_number())
-    if not card:
-        create_a_card(trello_board, analyzer, config)
-        return
+    full_sync_interval = config.get('gerrit.full_sync_interval',
+                                    _gerrit.DEFAULT_FULL_SYNC_INTERVAL)
 
-    # TODO: maybe update with a new title if needed?
-
-    apply_labels_to_card(trello_board, card, analyzer.get_labels(), config)
-    move_existing_card_to_list(
-        trello_board, card, analyzer.get_card_list_name())
-
-
-def sync_reviews(query, gerrit, trello_board, config):
-    touched_change_numbers = set()
-    for review in gerrit.run_query(query):
-        analyzer = ReviewAnalyzer(review, config['gerrit.username'])
-        logger.debug('Processing %s', analyzer.get_number())
-        touched_change_numbers.add(analyzer.get_number())
-        sync_thing(analyzer, trello_board, config)
-
-        # TODO: determine if I really want to automatically unstar changes
-        # if review.status == Status.DONE:
-        #     gerrit.unstar(review.id)
-
-    return touched_change_numbers
-
-
-def sync_bugs(bugs, trello_board, config):
-    touched_bug_numbers = set()
-    for bug in bugs:
-        analyzer = BugAnalizer(bug)
-        logger.debug('Processing %s', analyzer.get_number())
-        touched_bug_numbers.add(analyzer.get_number())
-        sync_thing(analyzer, trello_board, config)
-
-    return touched_bug_numbers
-
-
-def main():
-    config = _common.init_app()
-
-    g = _gerrit.Gerrit(config['gerrit.base_url'],
-                       config['gerrit.username'],
-                       config['gerrit.password'])
-    t = _trello.TrelloBoard(config['trello.key'],
-                            config['trello.token'],
-                            config['trello.board_id'])
-    l = _launchpad.LaunchPad(config['launchpad.username'])
-
-    touched_change_numbers = set()
-    for query in config['gerrit.queries']:
-        touched_change_numbers.update(sync_reviews(query, g, t, config))
-
-    touched_bug_numbers = set()
-    touched_bug_numbers.update(sync_bugs(l.get_my_bugs(), t, config))
-    touched_bug_numbers.update(sync_bugs(l.get_bugs_i_commented_on(), t, config))
-    touched_bug_numbers.update(sync_bugs(l.get_subscribed_bugs(), t, config))
-
-    # any extra Trello cards to get rid of?
-    all_trello_cards = set(card.number for card in t)
-    orphaned_card_numbers = (all_trello_cards -
-                             touched_change_numbers -
-                             touched_bug_numbers)
-    if None in orphaned_card_numbers:
-        # NOTE: None is the result of adding a card by hand that doesn't
-        # conform to the naming conventions used by the Gerrit and
-        # Launchpad cards. We manually added these so we should also manually
-        # delete them.
-        orphaned_card_numbers.remove(None)
-    for number in orphaned_card_numbers:
-        logger.info('removing orphaned Trello card: %s', number)
-        t.cards.get(number).delete()
+    def run(query):
+        incremental = None
+        if state is None:
+            reviews = gerrit.run_query(query)
+        else:
+            incremental = _gerrit.IncrementalQuery(gerrit, query, state,
+                                                   full_sync_interval)
+            reviews = incremental.run()
+        numbers = set()
+        for review in reviews:
+            numbers.add(review.number)
+            found(review)
+        return numbers, (set() if incremental is None
+                         else incremental.unchanged_numbers)
+
+    # NOTE: found may block until the planner catches up, so the queries
+    # get threads of their own rather than tying up the executor's workers
+    numbers = set()
+    unchanged_numbers = set()
+    for query_numbers, query_unchanged_numbers in run_concurrently(
+            [functools.partial(run, query)
+             for query in config['gerrit.queries']]):
+        numbers.update(query_numbers)
+        unchanged_numbers.update(
+            'gerrit:%s' % number for number in query_unchanged_numbers)
+    return numbers, unchanged_numbers
+
+
+def run_concurrently(calls):
+    """Call each function in a thread of its own and return the results.
+
+    The functions are free to wait on work that they submit to the shared
+    executor; they would tie up its workers, and could deadlock it, if they
+    ran there themselves. The first failure is raised once they have all
+    finished.
+    """
+    if len(calls) == 1:
+        return [calls[0]()]
+    with futures.ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        pending = [pool.submit(call) for call in calls]
+    return [future.result() for future in pending]
+
+
+def fetch_bugs(config, launchpad, state=None):
+    """Return the bug tasks to sync along with the numbers of unchanged bugs.
+
+    The searches run at the same time. Without a state every search is run
+    in full and nothing is unchanged.
+    """
+    from os_trello import _launchpad
+
+    full_sync_interval = config.get('launchpad.full_sync_interval',
+                                    _launchpad.DEFAULT_FULL_SYNC_INTERVAL)
+
+    def run(name, search):
+        if state is None:
+            return list(search()), set()
+        incremental = _launchpad.IncrementalSearch(search, name, state,
+                                                   full_sync_interval)
+        return list(incremental.run()), incremental.unchanged_numbers
+
+    bugs = []
+    unchanged_numbers = set()
+    for search_bugs, search_unchanged_numbers in run_concurrently([
+            functools.partial(run, 'assignee', launchpad.get_my_bugs),
+            functools.partial(run, 'bug_commenter',
+                              launchpad.get_bugs_i_commented_on),
+            functools.partial(run, 'bug_subscriber',
+                              launchpad.get_subscribed_bugs)]):
+        bugs.extend(search_bugs)
+        unchanged_numbers.update(
+            'lp:%s' % number for number in search_unchanged_numbers)
+    return bugs, unchanged_numbers
+
+
+class Planner(object):
+    """Diff the analyzed items against the board, one at a time.
+
+    Only the first of the items with the same number counts. Items that the
+    analysis cache, if there is one, says haven't changed are left alone.
+    Orphans are archived instead of deleted if ``archive`` is set.
+    """
+
+    def __init__(self, cache=None, archive=False):
+        self.plan = _plan.Plan()
+        self._cache = cache
+        self._archive = archive
+        self._touched_numbers = set()
+
+    def add(self, trello_board, analyzer):
+        """Plan an item and return the operations it needs."""
+        number = analyzer.get_number()
+        if number in self._touched_numbers:
+            # NOTE: a bug shows up once per task and overlapping queries
+            # return the same review; only the first one counts.
+            logger.debug('Skipping duplicate %s', number)
+            return []
+        logger.debug('Processing %s', number)
+        self._touched_numbers.add(number)
+        described_version = None
+        if self._cache is not None:
+            fingerprint = analyzer.get_fingerprint()
+            self.plan.fingerprints[number] = fingerprint
+            self.plan.description_versions[number] = (
+                analyzer.get_description_version())
+            if self._cache.is_unchanged(number, fingerprint, trello_board):
+                return []
+            described_version = self._cache.described_version(number)
+        operations = _plan.plan_card(trello_board, analyzer,
+                                     described_version)
+        self.plan.extend(operations)
+        return operations
+
+    def add_orphans(self, trello_board, unchanged_numbers=()):
+        """Plan the removal of the cards that are no longer synced.
+
+        This must wait until all of the items have been added. Cards for
+        the unchanged numbers are left alone.
+        """
+        operations = _plan.plan_orphans(
+            trello_board, self._touched_numbers.union(unchanged_numbers),
+            self._archive)
+        self.plan.extend(operations)
+        return operations
+
+
+class Shared(object):
+    """What the syncs for all of the boards share.
+
+    The HTTP connections, rate limits and cache are shared, along with the
+    results of the Gerrit queries and the Launchpad bugs that more than one
+    board needs. Trello sessions carry each user's token so they aren't.
+    """
+
+    def __init__(self, config, stats=None):
+        from os_trello import _http
+        from os_trello import _launchpad
+
+        self.stats = stats or _stats.Registry()
+        self.transport = _http.Transport.from_config(config, self.stats)
+        self.gerrit_session = self.transport.session(cache=True)
+        # NOTE: sharing a query's results means holding on to all of them,
+        # which is only worth it when there are other boards to share with
+        self.gerrit_queries = (_utils.FetchOnce() if config.get('tenants')
+                               else None)
+        self.gerrit_commits = _utils.FetchOnce()
+        self.launchpad_session = self.transport.session(cache=True)
+        self.bug_cache = _launchpad.BugCache(self.launchpad_session)
+        self._mirrors = {}  # indexed by filename
+
+    def mirror(self, filename):
+        from os_trello import _mirror
+
+        if filename not in self._mirrors:
+            self._mirrors[filename] = _mirror.BoardMirror(filename)
+        return self._mirrors[filename]
+
+    def close(self):
+        self.transport.close()
+
+    def forget(self, sources):
+        """Forget the shared results for sources that will be fetched again.
+        """
+        if 'gerrit' in sources:
+            if self.gerrit_queries is not None:
+                self.gerrit_queries.clear()
+            self.gerrit_commits.clear()
+        if 'launchpad' in sources:
+            self.bug_cache.clear()
+
+
+class Syncer(object):
+    """The clients and results of a board's sync, kept between syncs.
+
+    A single run uses one of these once. In daemon mode it is reused for
+    every sync so that the connections, caches and the loaded board stay
+    warm, and the results of a source that isn't due are simply reused;
+    ``keep_results`` holds on to the reviews for that.
+    """
+
+    def __init__(self, config, executor, shared=None, keep_results=False):
+        from os_trello import _gerrit
+        from os_trello import _launchpad
+
+        self.config = config
+        self.keep_results = keep_results
+        self.executor = executor
+        self.name = config.get('name')
+        shared = shared or Shared(config)
+        self.stats = shared.stats
+
+        self.gerrit = _gerrit.Gerrit(
+            config['gerrit.base_url'],
+            config['gerrit.username'],
+            config['gerrit.password'],
+            session=shared.gerrit_session,
+            page_size=config.get('gerrit.page_size',
+                                 _gerrit.DEFAULT_PAGE_SIZE),
+            query_cache=shared.gerrit_queries,
+            commit_cache=shared.gerrit_commits)
+        self.launchpad = _launchpad.LaunchPad(
+            config['launchpad.username'],
+            session=shared.launchpad_session,
+            page_size=config.get('launchpad.page_size',
+                                 _launchpad.DEFAULT_PAGE_SIZE),
+            statuses=config.get('launchpad.statuses'),
+            executor=executor,
+            bug_cache=shared.bug_cache)
+        self._trello_session = shared.transport.session(cache=True)
+        self._mirror = None
+        if config.get('trello.mirror'):
+            self._mirror = shared.mirror(config['trello.mirror'])
+
+        self.trello_board = None
+        self.state = None
+        self.analysis_cache = None
+        self._load_state()
+
+        self.reviews = []
+        self._review_numbers = set()
+        self.unchanged_numbers = set()
+        self.bugs = []
+        self.unchanged_bug_numbers = set()
+
+    def _load_state(self):
+        if (self.config.get('gerrit.incremental') or
+                self.config.get('launchpad.incremental') or
+                self.config.get('sync.skip_unchanged')):
+            self.state = _state.State(self.config.get(
+                'sync.state_file', _state.DEFAULT_STATE_FILE))
+        if self.config.get('sync.skip_unchanged'):
+            self.analysis_cache = _plan.AnalysisCache(self.state)
+
+    def timer(self, phase):
+        """Time a phase of the sync."""
+        labels = dict(phase=phase)
+        if self.name:
+            labels['board'] = self.name
+        return self.stats.timer('sync_phase_seconds', **labels)
+
+    def fetch_reviews(self, found):
+        """Run the Gerrit queries, calling ``found`` with each review."""
+        reviews = collections.OrderedDict()  # indexed by change number
+        lock = threading.Lock()
+
+        def keep(review):
+            if self.keep_results:
+                with lock:
+                    reviews.setdefault(review.number, review)
+            found(review)
+
+        with self.timer('gerrit_query'):
+            state = (self.state if self.config.get('gerrit.incremental')
+                     else None)
+            self._review_numbers, self.unchanged_numbers = run_queries(
+                self.config, self.gerrit, keep, state)
+        self.reviews = list(reviews.values())
+
+    def fetch_bugs(self):
+        with self.timer('launchpad_query'):
+            state = (self.state if self.config.get('launchpad.incremental')
+                     else None)
+            self.bugs, self.unchanged_bug_numbers = fetch_bugs(
+                self.config, self.launchpad, state)
+
+    def load_board(self):
+        from os_trello import _trello
+
+        with self.timer('board_load'):
+            if self.trello_board is None:
+                self.trello_board = _trello.TrelloBoard(
+                    self.config['trello.key'],
+                    self.config['trello.token'],
+                    self.config['trello.board_id'],
+                    session=self._trello_session,
+                    mirror=self._mirror)
+            else:
+                self.trello_board.refresh()
+
+    def tracks(self, number):
+        """Is the change with this number already being synced?"""
+        return ('gerrit:%s' % number in self.unchanged_numbers or
+                number in self._review_numbers)
+
+    def _prefetch(self, analyzer, review):
+        """Start fetching a commit message that planning will need."""
+        number = analyzer.get_number()
+        if (self.analysis_cache is not None and
+                self.analysis_cache.described_version(number) !=
+                review.current_revision):
+            self.executor.submit(getattr, review, 'commit_message')
+
+    def _produce_reviews(self, sources, put):
+        account_id = self.gerrit.account_id
+
+        def found(review):
+            analyzer = ReviewAnalyzer(review, account_id)
+            self._prefetch(analyzer, review)
+            put(analyzer)
+
+            # TODO: determine if I really want to automatically unstar
+            # changes
+            # if review.status == Status.DONE:
+            #     gerrit.unstar(review.id)
+
+        if 'gerrit' in sources:
+            # NOTE: once the analysis cache knows which cards have the
+            # current commit message, only the changes with a new revision
+            # need theirs and the rest aren't worth downloading
+            self.gerrit.fetch_commits = (self.analysis_cache is None or
+                                         not len(self.analysis_cache))
+            self.fetch_reviews(found)
+        else:
+            for review in self.reviews:
+                found(review)
+
+    def _produce_bugs(self, sources, put):
+        # NOTE: bugs are handed over once all of the searches are done so
+        # that which of a bug's tasks gets synced doesn't depend on which
+        # search finished first
+        if 'launchpad' in sources:
+            self.fetch_bugs()
+        for bug in self.bugs:
+            put(BugAnalizer(bug))
+
+    def run(self, sources, dry_run=False):
+        """Fetch the sources that are due and sync the board.
+
+        It all happens at once: the board is loaded while the sources are
+        fetched and each review and bug is planned, and its card written, as
+        soon as it has been found. Orphans can only be told apart once
+        everything has been found and written, so they are removed last.
+        """
+        planner = Planner(self.analysis_cache,
+                          self.config.get('sync.orphans') == 'archive')
+        # NOTE: planning stops to wait when the writes fall behind
+        writes = _pipeline.BoundedSubmitter(
+            self.executor, 2 * self.config.get('sync.workers',
+                                               DEFAULT_WORKERS))
+
+        def write(operations):
+            if operations and not dry_run:
+                _plan.submit(operations, self.trello_board,
+                             self.config.get('trello.label_colors.project'),
+                             writes)
+
+        with futures.ThreadPoolExecutor(max_workers=1) as pool:
+            loading = pool.submit(self.load_board)
+
+            def consume(analyzer):
+                loading.result()
+                with self.timer('analyze'):
+                    operations = planner.add(self.trello_board, analyzer)
+                write(operations)
+
+            _pipeline.Pipeline().run(
+                [functools.partial(self._produce_reviews, sources),
+                 functools.partial(self._produce_bugs, sources)], consume)
+            loading.result()
+
+        # NOTE: the writes reindex their cards, which planning the orphans
+        # must not catch halfway through
+        with self.timer('write'):
+            writes.wait()
+        with self.timer('orphans'):
+            orphans = planner.add_orphans(
+                self.trello_board,
+                self.unchanged_numbers | self.unchanged_bug_numbers)
+        write(orphans)
+        with self.timer('write'):
+            writes.wait()
+        self._finish(planner.plan, dry_run)
+
+    def _finish(self, plan, dry_run=False):
+        for operation in plan:
+            self.stats.count('sync_operations_total',
+                             operation=type(operation).__name__)
+        if dry_run:
+            prefix = '%s: ' % self.name if self.name else ''
+            # NOTE: boards are synced at the same time; keep plans together
+            with _print_lock:
+                for operation in plan:
+                    print('%s%s' % (prefix, operation))
+            return
+
+        logger.info('applied %d changes to Trello', len(plan))
+
+        # NOTE: only remember what was synced once it has made it to Trello
+        with self.timer('save'):
+            self.trello_board.save_mirror()
+            if self.analysis_cache is not None:
+                self.analysis_cache.record(
+                    plan, self.trello_board,
+                    self.unchanged_numbers | self.unchanged_bug_numbers)
+            if self.state is not None:
+                self.state.save()
+
+    def discard_progress(self):
+        """Forget what a failed sync did so the next one starts over."""
+        self.trello_board = None
+        self._load_state()
+
+
+def tenant_configs(config):
+    """Return the config for each board listed under tenants.
+
+    Each tenant's settings are laid over the rest of the config file. A
+    config without tenants is for a single board.
+    """
+    tenants = config.get('tenants')
+    if not tenants:
+        return [config]
+
+    state_file, ext = os.path.splitext(config.get(
+        'sync.state_file', _state.DEFAULT_STATE_FILE))
+    configs = []
+    for tenant in tenants:
+        # NOTE: incremental queries remember their progress by query so
+        # every tenant needs a state of its own
+        defaults = {'sync': {
+            'state_file': '%s-%s%s' % (state_file, tenant['name'], ext)}}
+        configs.append(config.overlay(defaults).overlay(tenant))
+    return configs
+
+
+def run_all(syncers, sources, dry_run=False, keep_going=False):
+    """Run the syncers for all of the boards at the same time.
+
+    When ``keep_going`` is true a failed sync is logged and the others carry
+    on; otherwise the first failure is raised once they have all finished.
+    """
+    def run(syncer):
+        try:
+            syncer.run(sources, dry_run)
+        except Exception:
+            if not keep_going:
+                raise
+            logger.exception('syncing %s failed; trying again later',
+                             syncer.name or 'the board')
+            syncer.stats.count('sync_failures_total')
+            syncer.discard_progress()
+
+    run_concurrently([functools.partial(run, syncer) for syncer in syncers])
+
+
+def is_relevant_event(event, syncer):
+    """Could a Gerrit event change what is on the board?"""
+    from os_trello import _daemon
+
+    number, owner = _daemon.gerrit_event_change(event)
+    if number is None:
+        return False
+    username = syncer.config['gerrit.username']
+    reviewer = event.get('reviewer', {}).get('username')
+    return (owner == username or reviewer == username or
+            syncer.tracks(number))
+
+
+def start_event_feed(config, syncers, scheduler):
+    """Follow Gerrit's events, if configured, and return the feed."""
+    if not config.get('daemon.gerrit_events'):
+        return None
+    from os_trello import _daemon
+
+    event_delay = config.get('daemon.event_delay', DEFAULT_EVENT_DELAY)
+
+    def on_event(event):
+        if any(is_relevant_event(event, syncer) for syncer in syncers):
+            logger.debug('gerrit %s event; syncing soon', event['type'])
+            scheduler.trigger('gerrit', event_delay)
+
+    feed = _daemon.EventFeed(config['daemon.gerrit_events'], on_event)
+    feed.start()
+    return feed
+
+
+def run_daemon(syncers, shared, dry_run=False, on_synced=None):
+    """Sync whenever a source is due, until interrupted.
+
+    ``on_synced`` is called after each round of syncs.
+    """
+    # NOTE: the daemon's imports are only paid for by those running it
+    from os_trello import _daemon
+
+    config = syncers[0].config
+    scheduler = _daemon.Scheduler()
+    scheduler.add('gerrit', config.get('daemon.gerrit_interval',
+                                       DEFAULT_GERRIT_INTERVAL))
+    scheduler.add('launchpad', config.get('daemon.launchpad_interval',
+                                          DEFAULT_LAUNCHPAD_INTERVAL))
+    scheduler.add('trello', config.get('daemon.trello_interval',
+                                       DEFAULT_TRELLO_INTERVAL))
+    feed = start_event_feed(config, syncers, scheduler)
+
+    try:
+        while True:
+            sources = scheduler.wait()
+            logger.info('syncing %s', ', '.join(sources))
+            shared.forget(sources)
+            with shared.stats.timer('sync_seconds'):
+                run_all(syncers, sources, dry_run, keep_going=True)
+            if on_synced is not None:
+                on_synced()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if feed is not None:
+            feed.stop()
+
+
+def main(argv=None):
+    parser = _common.build_parser()
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help='print the changes that would be made to Trello and exit')
+    parser.add_argument(
+        '--daemon', action='store_true',
+        help='keep running and sync as things change')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='print how long each phase took and the requests that were '
+             'made when done')
+    parser.add_argument(
+        '--stats-file',
+        help='write the metrics to this file after every sync')
+    parser.add_argument(
+        '--stats-format', choices=('prometheus', 'json'),
+        default='prometheus',
+        help='the format of the stats file (default: %(default)s)')
+    args = parser.parse_args(argv)
+    config = _common.init_app(args)
+
+    executor = futures.ThreadPoolExecutor(
+        max_workers=config.get('sync.workers', DEFAULT_WORKERS))
+    shared = Shared(config)
+
+    def write_stats():
+        if args.stats_file:
+            shared.stats.write(args.stats_file, args.stats_format)
+
+    with executor:
+        syncers = [Syncer(tenant_config, executor, shared,
+                          keep_results=args.daemon)
+                   for tenant_config in tenant_configs(config)]
+        try:
+            if args.daemon:
+                run_daemon(syncers, shared, args.dry_run, write_stats)
+            else:
+                with shared.stats.timer('sync_seconds'):
+                    run_all(syncers, ('gerrit', 'launchpad'), args.dry_run)
+                write_stats()
+        finally:
+            shared.close()
+            if args.stats:
+                print(shared.stats.summary(), file=sys.stderr)
 
     return 0
@@ -0,0 +1,82 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_trello import _cache
+
+
+class TestSQLiteCache(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, 'cache.sqlite')
+
+    def cache(self, max_size=100):
+        cache = _cache.SQLiteCache(self.filename, max_size=max_size)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_responses_survive_between_runs(self):
+        self.cache().set('url', b'response')
+        self.assertEqual(b'response', self.cache().get('url'))
+
+    def test_missing_response(self):
+        self.assertEqual(None, self.cache().get('url'))
+
+    def test_delete(self):
+        cache = self.cache()
+        cache.set('url', b'response')
+        cache.delete('url')
+        self.assertEqual(None, cache.get('url'))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = self.cache()
+        cache.set('old', b'x' * 40)
+        cache.set('used', b'x' * 40)
+        cache.get('used')
+        cache.set('new', b'x' * 40)
+
+        self.assertEqual(None, cache.get('old'))
+        self.assertEqual(b'x' * 40, cache.get('used'))
+        self.assertEqual(b'x' * 40, cache.get('new'))
+
+    def test_reads_do_not_write(self):
+        cache = self.cache()
+        cache.set('url', b'response')
+        changes = cache._conn.total_changes
+        cache.get('url')
+        self.assertEqual(changes, cache._conn.total_changes)
+
+    def test_reads_are_written_when_closed(self):
+        cache = _cache.SQLiteCache(self.filename, max_size=100)
+        cache.set('old', b'x' * 40)
+        cache.set('used', b'x' * 40)
+        cache.get('used')
+        cache.close()
+
+        cache = self.cache()
+        cache.set('new', b'x' * 40)
+        self.assertEqual(None, cache.get('old'))
+        self.assertEqual(b'x' * 40, cache.get('used'))
+
+    def test_replacing_a_response_does_not_count_it_twice(self):
+        cache = self.cache()
+        cache.set('url', b'x' * 60)
+        cache.set('url', b'x' * 60)
+        self.assertEqual(b'x' * 60, cache.get('url'))
@@ -13,6 +13,9 @@
 # under the License.
 
 import os
+import shutil
+import stat
+import tempfile
 import unittest
 
 from os_trello import _config
@@ -63,3 +66,62 @@ class TestConfigUsingGetItem(BaseTestConfig, unittest.TestCase):
     def test_getting_a_setting_that_doesnt_exist(self):
         with self.assertRaises(_config.SettingNotFound):
             self.config['root.not_there']
+
+
+class TestConfigOverlay(BaseTestConfig, unittest.TestCase):
+
+    def test_overrides_are_merged(self):
+        config = self.config.overlay({'root': {'branch1': {'leaf2': 2}}})
+        self.assertEqual({'leaf1': 0, 'leaf2': 2}, config['root.branch1'])
+        self.assertEqual(0, config['root.leaf0'])
+
+    def test_original_is_unchanged(self):
+        self.config.overlay({'root': {'leaf0': 1}})
+        self.assertEqual(0, self.config['root.leaf0'])
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, 'os-trello.yaml')
+        self.cache_file = os.path.join(directory, 'cache', 'config.pickle')
+        self.write_config('root: {leaf0: 0}\n')
+
+    def write_config(self, content, mtime=1000000000):
+        with open(self.filename, 'w') as f:
+            f.write(content)
+        os.utime(self.filename, (mtime, mtime))
+
+    def load(self):
+        return _config.Config(self.filename, self.cache_file)
+
+    def test_parsed_config_is_cached(self):
+        self.load()
+        self.assertTrue(os.path.exists(self.cache_file))
+
+    def test_cache_is_used_while_the_file_is_unchanged(self):
+        self.load()
+        # NOTE: same size and mtime, so only the cache can tell
+        self.write_config('root: {leaf0: 1}\n')
+        self.assertEqual(0, self.load()['root.leaf0'])
+
+    def test_cache_is_invalidated_when_the_file_changes(self):
+        self.load()
+        self.write_config('root: {leaf0: 1}\n', mtime=1000000001)
+        self.assertEqual(1, self.load()['root.leaf0'])
+
+    def test_cache_is_only_readable_by_its_owner(self):
+        self.load()
+        mode = os.stat(self.cache_file).st_mode
+        self.assertEqual(0o600, stat.S_IMODE(mode))
+        mode = os.stat(os.path.dirname(self.cache_file)).st_mode
+        self.assertEqual(0o700, stat.S_IMODE(mode))
+
+    def test_unreadable_cache_is_replaced(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        with open(self.cache_file, 'w') as f:
+            f.write('not a pickle')
+        self.assertEqual(0, self.load()['root.leaf0'])
+        self.assertEqual(0, self.load()['root.leaf0'])
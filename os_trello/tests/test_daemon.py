@@ -0,0 +1,85 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from os_trello import _daemon
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = _daemon.Scheduler(clock=self.clock)
+        self.scheduler.add('gerrit', 300)
+        self.scheduler.add('launchpad', 900)
+
+    def test_everything_is_due_at_first(self):
+        self.assertEqual(['gerrit', 'launchpad'], self.scheduler.pop_due())
+        self.assertEqual([], self.scheduler.pop_due())
+
+    def test_sources_are_polled_at_their_own_intervals(self):
+        self.scheduler.pop_due()
+        self.clock.now += 300
+        self.assertEqual(['gerrit'], self.scheduler.pop_due())
+        self.clock.now += 600
+        self.assertEqual(['gerrit', 'launchpad'], self.scheduler.pop_due())
+
+    def test_triggered_source_is_due_after_the_delay(self):
+        self.scheduler.pop_due()
+        self.scheduler.trigger('gerrit', delay=10)
+        self.scheduler.trigger('gerrit', delay=10)
+        self.clock.now += 5
+        self.assertEqual([], self.scheduler.pop_due())
+        self.clock.now += 5
+        self.assertEqual(['gerrit'], self.scheduler.wait())
+
+
+class TestEventFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.feed = _daemon.EventFeed('ssh review gerrit stream-events',
+                                      self.events.append)
+
+    def test_events_are_parsed(self):
+        self.feed.handle(b'{"type": "change-merged"}\n')
+        self.assertEqual([{'type': 'change-merged'}], self.events)
+
+    def test_malformed_events_are_ignored(self):
+        self.feed.handle(b'Connection closed\n')
+        self.assertEqual([], self.events)
+
+
+class TestGerritEventChange(unittest.TestCase):
+
+    def test_change_event(self):
+        event = {'type': 'comment-added',
+                 'change': {'number': '1234',
+                            'owner': {'username': 'dstanek'}}}
+        self.assertEqual((1234, 'dstanek'),
+                         _daemon.gerrit_event_change(event))
+
+    def test_event_without_a_change(self):
+        event = {'type': 'ref-updated', 'refUpdate': {}}
+        self.assertEqual((None, None), _daemon.gerrit_event_change(event))
@@ -0,0 +1,74 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+import requests
+
+from os_trello import _fakes
+
+
+class TestFixtureBuilder(unittest.TestCase):
+
+    def test_board_is_filled_up_to_the_number_of_cards(self):
+        fixtures = _fakes.FixtureBuilder(cards=200, reviews=50, bugs=10,
+                                         churn=0.1).build()
+        self.assertEqual(200, len(fixtures['board']['cards']))
+        self.assertEqual(50, len(fixtures['changes']))
+        self.assertEqual(10, len(fixtures['tasks']))
+
+    def test_fixtures_are_repeatable(self):
+        self.assertEqual(_fakes.FixtureBuilder(cards=20, reviews=10).build(),
+                         _fakes.FixtureBuilder(cards=20, reviews=10).build())
+
+
+class TestRequestCounter(unittest.TestCase):
+
+    def test_ids_are_collapsed(self):
+        counter = _fakes.RequestCounter()
+        counter.count('trello', 'PUT', '/1/cards/%024x' % 1)
+        counter.count('trello', 'PUT', '/1/cards/%024x' % 2)
+        counter.count('launchpad', 'GET', '/1.0/bugs/1234567')
+        self.assertEqual({'trello PUT /1/cards/{id}': 2,
+                          'launchpad GET /1.0/bugs/{id}': 1},
+                         counter.snapshot())
+
+
+class TestFakeServices(unittest.TestCase):
+
+    def setUp(self):
+        fixtures = _fakes.FixtureBuilder(cards=20, reviews=10, bugs=4,
+                                         churn=0).build()
+        self.services = _fakes.FakeServices(fixtures)
+        self.services.start()
+        self.addCleanup(self.services.stop)
+        self.trello_url = self.services.hosts[_fakes.TRELLO_HOST]
+
+    def test_board_is_served(self):
+        board = requests.get(self.trello_url + '/1/boards/benchmark').json()
+        self.assertEqual(20, len(board['cards']))
+        self.assertEqual(1, len(board['actions']))
+
+    def test_requests_are_counted(self):
+        requests.get(self.trello_url + '/1/boards/benchmark')
+        stats = requests.get(self.trello_url + '/_stats').json()
+        self.assertEqual(1, stats['trello GET /1/boards/benchmark'])
+
+    def test_unchanged_resource_is_not_modified(self):
+        url = self.trello_url + '/1/boards/benchmark'
+        etag = requests.get(url).headers['ETag']
+        response = requests.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        stats = requests.get(self.trello_url + '/_stats').json()
+        self.assertEqual(1, stats['trello GET /1/boards/benchmark (304)'])
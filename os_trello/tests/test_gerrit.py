@@ -0,0 +1,209 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import unittest
+
+from os_trello import _gerrit
+from os_trello import _utils
+
+
+def review(number, updated):
+    return _gerrit.GerritReview(
+        {'_number': number, 'updated': updated + '.000000000'})
+
+
+class FakeGerrit(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def run_query(self, query):
+        self.queries.append(query)
+        return iter(self.results.pop(0))
+
+
+class TestIncrementalQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.state = {}
+        self.now = 1000
+
+    def run_query(self, gerrit):
+        query = _gerrit.IncrementalQuery(gerrit, 'is:starred', self.state,
+                                         full_sync_interval=100,
+                                         clock=lambda: self.now)
+        return query, list(query.run())
+
+    def test_first_run_fetches_everything(self):
+        gerrit = FakeGerrit([review(1, '2015-06-01 10:00:00'),
+                             review(2, '2015-06-02 10:00:00')])
+        query, reviews = self.run_query(gerrit)
+
+        self.assertEqual(['is:starred'], gerrit.queries)
+        self.assertEqual(2, len(reviews))
+        self.assertEqual(set(), query.unchanged_numbers)
+        self.assertEqual('2015-06-02 10:00:00',
+                         self.state['gerrit']['is:starred']['updated'])
+
+    def test_later_runs_only_fetch_updated_changes(self):
+        gerrit = FakeGerrit([review(1, '2015-06-01 10:00:00'),
+                             review(2, '2015-06-02 10:00:00')],
+                            [review(2, '2015-06-03 10:00:00')])
+        self.run_query(gerrit)
+        self.now += 10
+        query, reviews = self.run_query(gerrit)
+
+        self.assertEqual('is:starred after:"2015-06-02 10:00:00 +0000"',
+                         gerrit.queries[1])
+        self.assertEqual([2], [r.number for r in reviews])
+        self.assertEqual(set([1]), query.unchanged_numbers)
+        self.assertEqual('2015-06-03 10:00:00',
+                         self.state['gerrit']['is:starred']['updated'])
+
+    def test_state_is_updated_once_everything_was_fetched(self):
+        gerrit = FakeGerrit([review(1, '2015-06-01 10:00:00')])
+        query = _gerrit.IncrementalQuery(gerrit, 'is:starred', self.state)
+        reviews = query.run()
+
+        self.assertEqual(1, next(reviews).number)
+        self.assertEqual({}, self.state['gerrit'])
+        self.assertEqual([], list(reviews))
+        self.assertEqual([1], self.state['gerrit']['is:starred']['seen'])
+
+    def test_full_sync_forgets_changes_that_stopped_matching(self):
+        gerrit = FakeGerrit([review(1, '2015-06-01 10:00:00'),
+                             review(2, '2015-06-02 10:00:00')],
+                            [review(2, '2015-06-02 10:00:00')])
+        self.run_query(gerrit)
+        self.now += 100
+        query, reviews = self.run_query(gerrit)
+
+        self.assertEqual('is:starred', gerrit.queries[1])
+        self.assertEqual(set(), query.unchanged_numbers)
+        self.assertEqual([2], self.state['gerrit']['is:starred']['seen'])
+
+
+class FakeResponse(object):
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession(object):
+
+    def __init__(self, *pages):
+        self.pages = list(pages)
+        self.urls = []
+
+    def get(self, url, auth=None):
+        self.urls.append(url)
+        return FakeResponse(")]}'\n" + json.dumps(self.pages.pop(0)))
+
+
+class TestRunQuery(unittest.TestCase):
+
+    def test_pages_are_followed(self):
+        session = FakeSession(
+            [{'_number': 1}, {'_number': 2, '_more_changes': True}],
+            [{'_number': 3}])
+        gerrit = _gerrit.Gerrit('https://review.openstack.org', 'user',
+                                'password', session=session, page_size=2)
+        reviews = gerrit.run_query('is:starred')
+
+        self.assertEqual([1, 2, 3], [review.number for review in reviews])
+        self.assertIn('n=2&S=0', session.urls[0])
+        self.assertIn('n=2&S=2', session.urls[1])
+
+    def test_an_empty_page_ends_the_query(self):
+        session = FakeSession([])
+        gerrit = _gerrit.Gerrit('https://review.openstack.org', 'user',
+                                'password', session=session)
+        self.assertEqual([], list(gerrit.run_query('is:starred')))
+        self.assertEqual(1, len(session.urls))
+
+
+class TestDetails(unittest.TestCase):
+
+    def gerrit(self, *pages):
+        self.session = FakeSession(*pages)
+        return _gerrit.Gerrit('https://review.openstack.org', 'user',
+                              'password', session=self.session,
+                              fetch_commits=False)
+
+    def test_commits_can_be_left_out_of_queries(self):
+        gerrit = self.gerrit([])
+        list(gerrit.run_query('is:starred'))
+        self.assertNotIn('CURRENT_COMMIT', self.session.urls[0])
+        self.assertNotIn('DETAILED_ACCOUNTS', self.session.urls[0])
+
+    def test_missing_commit_message_is_fetched_once(self):
+        gerrit = self.gerrit(
+            [{'_number': 1, 'current_revision': 'abc',
+              'revisions': {'abc': {}}}],
+            {'message': 'Fix it'})
+        review = next(gerrit.run_query('is:starred'))
+        self.assertEqual('Fix it', review.commit_message)
+        self.assertEqual('Fix it', review.commit_message)
+        self.assertEqual(
+            'https://review.openstack.org/a/changes/1/revisions/abc/commit',
+            self.session.urls[1])
+        self.assertEqual(2, len(self.session.urls))
+
+    def test_account_id_is_fetched_once(self):
+        gerrit = self.gerrit({'_account_id': 1234})
+        self.assertEqual(1234, gerrit.account_id)
+        self.assertEqual(1234, gerrit.account_id)
+        self.assertEqual(1, len(self.session.urls))
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession([{'_number': 1}], [{'_number': 2}])
+        self.query_cache = _utils.FetchOnce()
+
+    def gerrit(self, username, fetch_commits=True):
+        return _gerrit.Gerrit('https://review.openstack.org', username,
+                              'password', session=self.session,
+                              query_cache=self.query_cache,
+                              fetch_commits=fetch_commits)
+
+    def numbers(self, gerrit, query):
+        return [review.number for review in gerrit.run_query(query)]
+
+    def test_identical_queries_are_shared(self):
+        query = 'project:openstack/keystone is:open'
+        self.assertEqual([1], self.numbers(self.gerrit('alice'), query))
+        self.assertEqual([1], self.numbers(self.gerrit('bob'), query))
+        self.assertEqual(1, len(self.session.urls))
+
+    def test_queries_relative_to_the_user_are_not_shared(self):
+        self.assertEqual([1], self.numbers(self.gerrit('alice'),
+                                           'is:starred'))
+        self.assertEqual([2], self.numbers(self.gerrit('bob'), 'is:starred'))
+        self.assertEqual([1], self.numbers(self.gerrit('alice'),
+                                           'is:starred'))
+        self.assertEqual(2, len(self.session.urls))
+
+    def test_results_without_commits_are_not_shared(self):
+        query = 'project:openstack/keystone is:open'
+        self.assertEqual([1], self.numbers(
+            self.gerrit('alice', fetch_commits=False), query))
+        self.assertEqual([2], self.numbers(self.gerrit('bob'), query))
+        self.assertIn('CURRENT_COMMIT', self.session.urls[1])
@@ -0,0 +1,229 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import unittest
+
+import requests
+from six.moves import BaseHTTPServer
+
+from os_trello import _http
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse(object):
+
+    def __init__(self, headers=None, status_code=200):
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAdapter(_http.RateLimitedAdapter):
+    """Answer with canned responses instead of going over the network."""
+
+    def __init__(self, transport, *responses):
+        super(FakeAdapter, self).__init__(transport)
+        self.responses = list(responses)
+        self.sent = []
+
+    def _send(self, request, labels, *args, **kwargs):
+        self.sent.append(request.method)
+        return self.responses.pop(0)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = _http.TokenBucket(2, 3, clock=self.clock,
+                                        sleep=self.clock.sleep)
+
+    def test_burst_does_not_wait(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_waits_once_the_burst_is_used_up(self):
+        for _ in range(5):
+            self.bucket.acquire()
+        self.assertEqual([0.5, 0.5], self.clock.sleeps)
+
+    def test_tokens_are_refilled_over_time(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.clock.now += 1
+        self.bucket.acquire()
+        self.bucket.acquire()
+        self.assertEqual([], self.clock.sleeps)
+
+
+class TestRetryDelay(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = _http.Transport(backoff_factor=1)
+
+    def test_retry_after_in_seconds(self):
+        response = FakeResponse({'Retry-After': '7'})
+        self.assertEqual(7, self.transport.retry_delay(response, 0))
+
+    def test_retry_after_is_capped(self):
+        response = FakeResponse({'Retry-After': '86400'})
+        self.assertEqual(_http.MAX_BACKOFF,
+                         self.transport.retry_delay(response, 0))
+
+    def test_retry_after_as_a_date(self):
+        delay = _http.parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT',
+                                        clock=lambda: 1445412480)
+        self.assertEqual(10, delay)
+
+    def test_backoff_is_jittered_and_capped(self):
+        for attempt in range(10):
+            delay = self.transport.retry_delay(FakeResponse(), attempt)
+            self.assertTrue(0 <= delay <= min(_http.MAX_BACKOFF,
+                                              2 ** attempt))
+
+
+class TestIsRetryable(unittest.TestCase):
+
+    def test_throttled_requests_are_retried(self):
+        self.assertTrue(_http.is_retryable('GET', 429))
+        self.assertTrue(_http.is_retryable('POST', 429))
+
+    def test_unavailable_is_only_retried_when_idempotent(self):
+        self.assertTrue(_http.is_retryable('PUT', 503))
+        self.assertFalse(_http.is_retryable('POST', 503))
+
+    def test_other_statuses_are_not_retried(self):
+        self.assertFalse(_http.is_retryable('GET', 500))
+
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = _http.Transport(max_retries=2)
+
+    def send(self, method, *responses):
+        adapter = FakeAdapter(self.transport, *responses)
+        request = requests.Request(
+            method, 'https://trello.com/1/cards').prepare()
+        return adapter, adapter.send(request)
+
+    def test_throttled_request_is_retried(self):
+        throttled = FakeResponse({'Retry-After': '0'}, status_code=429)
+        adapter, response = self.send('POST', throttled, FakeResponse())
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['POST', 'POST'], adapter.sent)
+        self.assertTrue(throttled.closed)
+        self.assertEqual(1, dict(
+            (name, value) for (name, _), value
+            in self.transport.stats.counters())['http_retries_total'])
+
+    def test_unavailable_post_is_not_retried(self):
+        adapter, response = self.send(
+            'POST', FakeResponse({'Retry-After': '0'}, status_code=503),
+            FakeResponse())
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(['POST'], adapter.sent)
+
+    def test_retries_give_up_eventually(self):
+        responses = [FakeResponse({'Retry-After': '0'}, status_code=503)
+                     for _ in range(4)]
+        adapter, response = self.send('GET', *responses)
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(3, len(adapter.sent))
+
+
+class TestRewrite(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = _http.Transport(
+            hosts={'trello.com': 'http://127.0.0.1:8080/'})
+
+    def test_mapped_host_is_rewritten(self):
+        self.assertEqual(
+            'http://127.0.0.1:8080/1/boards/abc?fields=name',
+            self.transport.rewrite('https://trello.com/1/boards/abc'
+                                   '?fields=name'))
+
+    def test_other_hosts_are_left_alone(self):
+        url = 'https://review.openstack.org/a/changes/'
+        self.assertEqual(url, self.transport.rewrite(url))
+
+
+class ETagHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.conditions.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        body = b'{"name": "OpenStack"}'
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep the test output quiet
+
+
+class TestCachingWithRewrite(unittest.TestCase):
+
+    def setUp(self):
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), ETagHandler)
+        server.conditions = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+
+    def test_rewritten_host_is_revalidated(self):
+        transport = _http.Transport(hosts={
+            'trello.com': 'http://127.0.0.1:%d' % self.server.server_port})
+        session = transport.session(cache=True)
+        self.addCleanup(session.close)
+        url = 'https://trello.com/1/boards/abc'
+
+        first = session.get(url)
+        second = session.get(url)
+
+        self.assertEqual([None, '"v1"'], self.server.conditions)
+        self.assertEqual(first.json(), second.json())
+        self.assertTrue(second.from_cache)
@@ -0,0 +1,172 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from concurrent import futures
+
+from os_trello import _launchpad
+
+
+BUG_LINK = 'https://api.launchpad.net/1.0/bugs/1234'
+USER_URL = 'https://api.launchpad.net/1.0/~user'
+
+
+class FakeResponse(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class FakeSession(object):
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+        self.params = []
+
+    def get(self, url, params=None):
+        self.urls.append(url)
+        self.params.append(params)
+        start = dict(params or {}).get('ws.start', 0)
+        response = self.responses[url]
+        if isinstance(response, list):
+            response = response[start // 2]
+        return FakeResponse(response)
+
+
+class TestBugDescription(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession({BUG_LINK: {'description': 'broken'}})
+        self.bug_cache = _launchpad.BugCache(self.session)
+
+    def bug(self):
+        return _launchpad.Bug({'bug_link': BUG_LINK}, self.session,
+                              self.bug_cache)
+
+    def test_bug_is_not_fetched_until_needed(self):
+        self.bug()
+        self.assertEqual([], self.session.urls)
+
+    def test_tasks_of_the_same_bug_share_a_fetch(self):
+        self.assertEqual('broken', self.bug().description)
+        self.assertEqual('broken', self.bug().description)
+        self.assertEqual([BUG_LINK], self.session.urls)
+
+
+def task(number):
+    return {'bug_link': 'https://api.launchpad.net/1.0/bugs/%d' % number}
+
+
+class TestSearch(unittest.TestCase):
+
+    def test_next_collection_links_are_followed(self):
+        session = FakeSession({
+            USER_URL: {'entries': [task(1), task(2)],
+                       'next_collection_link': 'next'},
+            'next': {'entries': [task(3)]},
+        })
+        launchpad = _launchpad.LaunchPad('user', session=session)
+        bugs = launchpad.get_my_bugs()
+
+        self.assertEqual(['1', '2', '3'], [bug.number for bug in bugs])
+        self.assertEqual([USER_URL, 'next'], session.urls)
+
+    def test_remaining_pages_are_prefetched(self):
+        session = FakeSession({
+            USER_URL: [
+                {'entries': [task(1), task(2)], 'total_size': 5},
+                {'entries': [task(3), task(4)], 'total_size': 5},
+                {'entries': [task(5)], 'total_size': 5},
+            ],
+        })
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            launchpad = _launchpad.LaunchPad('user', session=session,
+                                             page_size=2, executor=executor)
+            bugs = list(launchpad.get_subscribed_bugs())
+
+        self.assertEqual(['1', '2', '3', '4', '5'],
+                         [bug.number for bug in bugs])
+        self.assertEqual(3, len(session.urls))
+
+
+class FakeSearch(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def __call__(self, modified_since=None):
+        self.calls.append(modified_since)
+        return iter([_launchpad.Bug(task(number))
+                     for number in self.results.pop(0)])
+
+
+class TestIncrementalSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.state = {}
+        self.now = 1433152800  # 2015-06-01 10:00:00 UTC
+
+    def run_search(self, search):
+        incremental = _launchpad.IncrementalSearch(
+            search, 'assignee', self.state, full_sync_interval=86400,
+            clock=lambda: self.now)
+        return incremental, [bug.number for bug in incremental.run()]
+
+    def test_first_run_fetches_everything(self):
+        search = FakeSearch([1, 2])
+        incremental, numbers = self.run_search(search)
+
+        self.assertEqual([None], search.calls)
+        self.assertEqual(['1', '2'], numbers)
+        self.assertEqual(set(), incremental.unchanged_numbers)
+
+    def test_later_runs_only_fetch_modified_bugs(self):
+        search = FakeSearch([1, 2], [2])
+        self.run_search(search)
+        self.now += 3600
+        incremental, numbers = self.run_search(search)
+
+        self.assertEqual('2015-06-01T09:50:00+00:00', search.calls[1])
+        self.assertEqual(['2'], numbers)
+        self.assertEqual(set(['1']), incremental.unchanged_numbers)
+
+    def test_full_sync_forgets_bugs_that_stopped_matching(self):
+        search = FakeSearch([1, 2], [2])
+        self.run_search(search)
+        self.now += 86400
+        incremental, numbers = self.run_search(search)
+
+        self.assertEqual(None, search.calls[1])
+        self.assertEqual(set(), incremental.unchanged_numbers)
+        self.assertEqual(['2'], self.state['launchpad']['assignee']['seen'])
+
+
+class TestModifiedSince(unittest.TestCase):
+
+    def test_bound_is_sent_to_launchpad(self):
+        session = FakeSession({USER_URL: {'entries': []}})
+        launchpad = _launchpad.LaunchPad('user', session=session)
+        list(launchpad.get_my_bugs('2015-06-01T09:50:00+00:00'))
+
+        self.assertIn(('modified_since', '2015-06-01T09:50:00+00:00'),
+                      session.params[0])
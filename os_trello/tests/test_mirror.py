@@ -0,0 +1,107 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_trello import _mirror
+from os_trello import _utils
+
+
+def snapshot():
+    return dict(
+        id='board',
+        last_action_id='action-0',
+        cards=[dict(id='card-1', name='[1] subject', idList='list-1',
+                    idLabels=['label-1'])],
+        lists=[dict(id='list-1', name='Needs Work')],
+        labels=[dict(id='label-1', name='review', color='green')],
+    )
+
+
+def action(number, action_type, **data):
+    return dict(id='action-%d' % number, type=action_type, data=data)
+
+
+class TestApplyActions(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = snapshot()
+
+    def card(self):
+        cards = dict((card['id'], card) for card in self.snapshot['cards'])
+        return cards.get('card-1')
+
+    def test_last_action_is_remembered(self):
+        _mirror.apply_actions(self.snapshot, [
+            action(1, 'commentCard', card=dict(id='card-1')),
+            action(2, 'commentCard', card=dict(id='card-1')),
+        ])
+        self.assertEqual('action-2', self.snapshot['last_action_id'])
+
+    def test_card_updates_are_applied(self):
+        _mirror.apply_actions(self.snapshot, [
+            action(1, 'updateCard', card=dict(id='card-1', idList='list-2')),
+            action(2, 'updateCard', card=dict(id='card-1', desc='new')),
+            action(3, 'addLabelToCard', card=dict(id='card-1'),
+                   label=dict(id='label-2')),
+            action(4, 'removeLabelFromCard', card=dict(id='card-1'),
+                   label=dict(id='label-1')),
+        ])
+        self.assertEqual('list-2', self.card()['idList'])
+        self.assertEqual(_utils.content_hash('new'), self.card()['descHash'])
+        self.assertEqual(['label-2'], self.card()['idLabels'])
+
+    def test_archived_and_deleted_cards_are_removed(self):
+        _mirror.apply_actions(self.snapshot, [
+            action(1, 'updateCard', card=dict(id='card-1', closed=True)),
+        ])
+        self.assertEqual(None, self.card())
+
+    def test_unknown_cards_are_refetched(self):
+        refetch_ids = _mirror.apply_actions(self.snapshot, [
+            action(1, 'createCard', card=dict(id='card-2')),
+            action(2, 'createCard', card=dict(id='card-3')),
+            action(3, 'deleteCard', card=dict(id='card-3')),
+        ])
+        self.assertEqual(set(['card-2']), refetch_ids)
+
+    def test_list_and_label_changes_are_applied(self):
+        _mirror.apply_actions(self.snapshot, [
+            action(1, 'createList', list=dict(id='list-2', name='Done')),
+            action(2, 'deleteLabel', label=dict(id='label-1')),
+        ])
+        self.assertEqual(['list-1', 'list-2'],
+                         sorted(card_list['id']
+                                for card_list in self.snapshot['lists']))
+        self.assertEqual([], self.snapshot['labels'])
+
+
+class TestBoardMirror(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.filename = os.path.join(directory, 'mirror.sqlite')
+
+    def test_unknown_board(self):
+        mirror = _mirror.BoardMirror(self.filename)
+        self.assertEqual(None, mirror.load('kAcLdBiq'))
+
+    def test_saved_board_is_loaded(self):
+        _mirror.BoardMirror(self.filename).save('kAcLdBiq', snapshot())
+        loaded = _mirror.BoardMirror(self.filename).load('kAcLdBiq')
+        self.assertEqual(snapshot(), loaded)
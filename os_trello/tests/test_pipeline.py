@@ -0,0 +1,84 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import unittest
+
+from concurrent import futures
+
+from os_trello import _pipeline
+
+
+def producer(items, result=None):
+    def produce(put):
+        for item in items:
+            put(item)
+        return result
+    return produce
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = _pipeline.Pipeline(queue_size=2)
+        self.consumed = []
+
+    def test_everything_produced_is_consumed(self):
+        results = self.pipeline.run(
+            [producer(range(10), 'first'), producer(range(10, 15), 'second')],
+            self.consumed.append)
+        self.assertEqual(['first', 'second'], results)
+        self.assertEqual(list(range(15)), sorted(self.consumed))
+
+    def test_failed_producer_is_raised(self):
+        def fail(put):
+            put(1)
+            raise ValueError()
+
+        self.assertRaises(ValueError, self.pipeline.run,
+                          [fail, producer(range(2, 5))],
+                          self.consumed.append)
+        self.assertEqual([1, 2, 3, 4], sorted(self.consumed))
+
+    def test_failed_consumer_stops_the_producers(self):
+        def consume(item):
+            raise ValueError()
+
+        # NOTE: the producer would block forever on the full queue
+        self.assertRaises(ValueError, self.pipeline.run,
+                          [producer(range(100))], consume)
+
+
+class TestBoundedSubmitter(unittest.TestCase):
+
+    def test_submitting_waits_for_a_free_slot(self):
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        submitter = _pipeline.BoundedSubmitter(executor, limit=1)
+        release = threading.Event()
+        submitter.submit(release.wait)
+
+        submitted = threading.Event()
+
+        def submit_another():
+            submitter.submit(lambda: None)
+            submitted.set()
+
+        thread = threading.Thread(target=submit_another)
+        thread.start()
+        self.assertFalse(submitted.wait(0.1))
+        release.set()
+        thread.join()
+        submitter.wait()
+        self.assertTrue(submitted.is_set())
@@ -0,0 +1,206 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from os_trello import _plan
+from os_trello import _trello
+from os_trello import _utils
+
+
+class FakeAnalyzer(object):
+
+    def __init__(self, number, list_name, labels, subject='subject',
+                 description='description'):
+        self._number = number
+        self._list_name = list_name
+        self._labels = labels
+        self._subject = subject
+        self._description = description
+
+    def get_number(self):
+        return 'gerrit:%s' % self._number
+
+    def get_title(self):
+        return '[%s] %s' % (self._number, self._subject)
+
+    def get_url(self):
+        return 'https://review.openstack.org/%s' % self._number
+
+    def get_description(self):
+        return self._description
+
+    def get_description_version(self):
+        return self._description
+
+    def get_description_hash(self):
+        return _utils.content_hash(self._description)
+
+    def get_labels(self):
+        return self._labels
+
+    def get_card_list_name(self):
+        return self._list_name
+
+    def get_fingerprint(self):
+        return '%s %s' % (self._list_name, self._labels)
+
+
+class FakeBoard(object):
+
+    def __init__(self, cards):
+        self.labels = _trello.LabelCollection(None, None, 'board')
+        self.labels.load([dict(id='label-review', name='review')])
+        self.lists = _trello.ListCollection(None, None, 'board')
+        self.lists.load([dict(id='list-needs-work', name='Needs Work'),
+                         dict(id='list-done', name='Done')])
+        self.cards = _trello.CardCollection(None, None, 'board')
+        self.cards.load(cards)
+
+
+class TestPlanCard(unittest.TestCase):
+
+    def setUp(self):
+        self.board = FakeBoard([
+            dict(id='card-1', name='[1] subject', desc='description',
+                 idList='list-needs-work', idLabels=['label-review']),
+        ])
+
+    def test_new_item_is_created(self):
+        analyzer = FakeAnalyzer(2, 'Needs Work', ['review'])
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(1, len(operations))
+        self.assertIsInstance(operations[0], _plan.CreateCard)
+
+    def test_unchanged_card_has_no_operations(self):
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review'])
+        self.assertEqual([], _plan.plan_card(self.board, analyzer))
+
+    def test_card_is_moved_to_its_new_list(self):
+        analyzer = FakeAnalyzer(1, 'Done', ['review'])
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(1, len(operations))
+        self.assertIsInstance(operations[0], _plan.MoveCard)
+        self.assertEqual('Done', operations[0].list_name)
+
+    def test_oldest_duplicate_is_synced(self):
+        self.board.cards.load([
+            dict(id='card-0', name='[1] subject', desc='description',
+                 idList='list-done', idLabels=['label-review']),
+        ])
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review'])
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(['card-0'], [op.card.id for op in operations])
+
+    def test_new_title_is_written(self):
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review'],
+                                subject='new subject')
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(1, len(operations))
+        self.assertEqual('[1] new subject', operations[0].title)
+        self.assertFalse(operations[0].describe)
+
+    def test_new_description_is_written(self):
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review'],
+                                description='rebased')
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(1, len(operations))
+        self.assertIsNone(operations[0].title)
+        self.assertTrue(operations[0].describe)
+
+    def test_description_known_to_be_current_is_not_compared(self):
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review'],
+                                description='rebased')
+        self.assertEqual([], _plan.plan_card(self.board, analyzer,
+                                             described_version='rebased'))
+
+    def test_only_missing_labels_are_added(self):
+        analyzer = FakeAnalyzer(1, 'Needs Work', ['review', 'keystone'])
+        operations = _plan.plan_card(self.board, analyzer)
+        self.assertEqual(1, len(operations))
+        self.assertIsInstance(operations[0], _plan.AddLabels)
+        self.assertEqual(['keystone'], operations[0].label_names)
+
+
+class TestPlanOrphans(unittest.TestCase):
+
+    def test_untouched_cards_are_deleted(self):
+        board = FakeBoard([
+            dict(id='card-1', name='[1] subject', idList='list-done'),
+            dict(id='card-2', name='Bug #2 title', idList='list-done'),
+        ])
+        operations = _plan.plan_orphans(board, set(['gerrit:1']))
+        self.assertEqual(['card-2'], [op.card.id for op in operations])
+
+    def test_duplicates_of_synced_cards_are_deleted(self):
+        board = FakeBoard([
+            dict(id='card-2', name='[1] subject', idList='list-done'),
+            dict(id='card-1', name='[1] subject', idList='list-done'),
+        ])
+        operations = _plan.plan_orphans(board, set(['gerrit:1']))
+        self.assertEqual(['card-2'], [op.card.id for op in operations])
+
+    def test_orphans_can_be_archived(self):
+        board = FakeBoard([
+            dict(id='card-1', name='[1] subject', idList='list-done'),
+        ])
+        operations = _plan.plan_orphans(board, set(), archive=True)
+        self.assertEqual(1, len(operations))
+        self.assertIsInstance(operations[0], _plan.ArchiveCard)
+
+    def test_manually_added_cards_are_left_alone(self):
+        board = FakeBoard([
+            dict(id='card-1', name='remember the milk', idList='list-done'),
+        ])
+        self.assertEqual([], _plan.plan_orphans(board, set()))
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.board = FakeBoard([
+            dict(id='card-1', name='[1] subject', idList='list-needs-work',
+                 idLabels=['label-review']),
+        ])
+        self.state = {}
+        self.cache = _plan.AnalysisCache(self.state)
+        plan = _plan.Plan()
+        plan.fingerprints['gerrit:1'] = 'fingerprint'
+        self.cache.record(plan, self.board)
+
+    def test_recorded_item_is_unchanged(self):
+        self.assertTrue(self.cache.is_unchanged('gerrit:1', 'fingerprint',
+                                                self.board))
+
+    def test_changed_item(self):
+        self.assertFalse(self.cache.is_unchanged('gerrit:1', 'changed',
+                                                 self.board))
+
+    def test_card_changed_on_the_board(self):
+        self.board.cards.get('gerrit:1')._data['idList'] = 'list-done'
+        self.assertFalse(self.cache.is_unchanged('gerrit:1', 'fingerprint',
+                                                 self.board))
+
+    def test_entries_are_kept_in_the_state(self):
+        cache = _plan.AnalysisCache(self.state)
+        self.assertTrue(cache.is_unchanged('gerrit:1', 'fingerprint',
+                                           self.board))
+
+    def test_only_unchanged_numbers_outlive_a_plan(self):
+        self.cache.record(_plan.Plan(), self.board, ['gerrit:1'])
+        self.assertTrue(self.cache.is_unchanged('gerrit:1', 'fingerprint',
+                                                self.board))
+        self.cache.record(_plan.Plan(), self.board)
+        self.assertFalse(self.cache.is_unchanged('gerrit:1', 'fingerprint',
+                                                 self.board))
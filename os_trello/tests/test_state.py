@@ -0,0 +1,45 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_trello import _state
+
+
+class TestState(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.filename = os.path.join(self.directory, 'nested', 'state.json')
+
+    def test_missing_file_is_empty(self):
+        state = _state.State(self.filename)
+        self.assertEqual(None, state.get('gerrit'))
+
+    def test_saved_state_is_loaded(self):
+        state = _state.State(self.filename)
+        state['gerrit'] = {'is:starred': {'seen': [1, 2]}}
+        state.save()
+
+        state = _state.State(self.filename)
+        self.assertEqual({'is:starred': {'seen': [1, 2]}}, state['gerrit'])
+
+    def test_nothing_is_written_until_saved(self):
+        state = _state.State(self.filename)
+        state['gerrit'] = {}
+        self.assertFalse(os.path.exists(self.filename))
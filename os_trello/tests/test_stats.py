@@ -0,0 +1,75 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import unittest
+
+from os_trello import _stats
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestEndpoint(unittest.TestCase):
+
+    def test_ids_are_collapsed(self):
+        self.assertEqual('/1/cards/{id}/idLabels',
+                         _stats.endpoint('/1/cards/%024x/idLabels' % 1))
+        self.assertEqual('/1.0/{id}', _stats.endpoint('/1.0/~dstanek'))
+        self.assertEqual('/a/changes/{id}/revisions/current/commit',
+                         _stats.endpoint('/a/changes/123456/revisions/'
+                                         'current/commit'))
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = _stats.Registry(clock=self.clock)
+
+    def test_counters_are_kept_per_label(self):
+        self.stats.count('requests_total', method='GET')
+        self.stats.count('requests_total', method='GET')
+        self.stats.count('requests_total', method='PUT')
+        self.assertEqual(
+            [(('requests_total', (('method', 'GET'),)), 2),
+             (('requests_total', (('method', 'PUT'),)), 1)],
+            self.stats.counters())
+
+    def test_timer(self):
+        with self.stats.timer('phase_seconds', phase='write'):
+            self.clock.now += 0.3
+        [(key, histogram)] = self.stats.histograms()
+        self.assertEqual(('phase_seconds', (('phase', 'write'),)), key)
+        self.assertEqual(1, histogram.count)
+        self.assertAlmostEqual(0.3, histogram.sum)
+
+    def test_prometheus_format(self):
+        self.stats.count('requests_total', method='GET')
+        self.stats.observe('request_seconds', 0.02)
+        lines = self.stats.to_prometheus().splitlines()
+
+        self.assertEqual('# TYPE os_trello_requests_total counter', lines[0])
+        self.assertEqual('os_trello_requests_total{method="GET"} 1',
+                         lines[1])
+        self.assertIn('os_trello_request_seconds_bucket{le="0.01"} 0', lines)
+        self.assertIn('os_trello_request_seconds_bucket{le="0.025"} 1',
+                      lines)
+        self.assertIn('os_trello_request_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn('os_trello_request_seconds_count 1', lines)
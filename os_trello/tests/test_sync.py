@@ -0,0 +1,122 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import unittest
+
+from concurrent import futures
+
+from os_trello import _gerrit
+from os_trello import _launchpad
+from os_trello.cmds import sync
+
+
+class FakeGerrit(object):
+
+    def __init__(self, results):
+        self.results = results
+
+    def run_query(self, query):
+        for number in self.results[query]:
+            yield _gerrit.GerritReview({'_number': number})
+
+
+class TestRunQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {'gerrit.queries': ['is:starred', 'owner:self is:open']}
+        self.found = []
+
+    def test_results_of_overlapping_queries_are_merged(self):
+        gerrit = FakeGerrit({'is:starred': [1, 2, 3],
+                             'owner:self is:open': [3, 4]})
+        numbers, unchanged_numbers = sync.run_queries(
+            self.config, gerrit, self.found.append)
+
+        self.assertEqual(set([1, 2, 3, 4]), numbers)
+        self.assertEqual([1, 2, 3, 3, 4],
+                         sorted(review.number for review in self.found))
+        self.assertEqual(set(), unchanged_numbers)
+
+    def test_reviews_are_found_while_the_query_runs(self):
+        found_first = threading.Event()
+
+        def run_query(query):
+            yield _gerrit.GerritReview({'_number': 1})
+            # NOTE: this would time out if the results were collected first
+            if not found_first.wait(5):
+                raise AssertionError('the first review was not found')
+            yield _gerrit.GerritReview({'_number': 2})
+
+        gerrit = FakeGerrit({})
+        gerrit.run_query = run_query
+        numbers, _ = sync.run_queries(self.config, gerrit,
+                                      lambda review: found_first.set())
+
+        self.assertEqual(set([1, 2]), numbers)
+
+
+class FakeLaunchpad(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def _bugs(self, modified_since=None):
+        return iter(_launchpad.Bug({'bug_link': 'bugs/%d' % number})
+                    for number in self.results.pop(0))
+
+    def get_my_bugs(self, modified_since=None):
+        return self._bugs(modified_since)
+
+    def get_bugs_i_commented_on(self, modified_since=None):
+        return iter([])
+
+    def get_subscribed_bugs(self, modified_since=None):
+        return iter([])
+
+
+class TestFetchBugs(unittest.TestCase):
+
+    def test_bugs_that_were_not_modified_are_unchanged(self):
+        launchpad = FakeLaunchpad([1, 2], [2])
+        state = {}
+        sync.fetch_bugs({}, launchpad, state)
+        bugs, unchanged_numbers = sync.fetch_bugs({}, launchpad, state)
+
+        self.assertEqual(['2'], [bug.number for bug in bugs])
+        self.assertEqual(set(['lp:1']), unchanged_numbers)
+
+
+class TestRunConcurrently(unittest.TestCase):
+
+    def test_calls_can_wait_on_each_other(self):
+        # NOTE: the second call would time out if they ran one at a time
+        started = futures.Future()
+
+        def first():
+            started.set_result(True)
+            return 'first'
+
+        def second():
+            return started.result(timeout=5) and 'second'
+
+        self.assertEqual(['second', 'first'],
+                         sync.run_concurrently([second, first]))
+
+    def test_failures_are_raised(self):
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, sync.run_concurrently,
+                          [fail, lambda: None])
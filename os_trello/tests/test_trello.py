@@ -0,0 +1,253 @@
+# Copyright 2015 David Stanek <dstanek@dstanek.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import io
+import json
+import logging
+import sys
+import threading
+import unittest
+
+from concurrent import futures
+
+from os_trello import _trello
+from os_trello import _utils
+
+
+class FakeResponse(object):
+
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception('HTTP %d' % self.status_code)
+
+    def json(self):
+        return self._data
+
+
+class FakeSession(object):
+
+    def __init__(self, status_code=200):
+        self.requests = []
+        self.status_code = status_code
+
+    def _request(self, method, url, data=None):
+        self.requests.append((method, url, data))
+        return FakeResponse(dict(data or {}, id='new-card'), self.status_code)
+
+    def put(self, url, data=None):
+        return self._request('PUT', url, data)
+
+    def post(self, url, data=None):
+        return self._request('POST', url, data)
+
+    def delete(self, url):
+        return self._request('DELETE', url)
+
+
+class FakeBoard(object):
+
+    def __init__(self, session):
+        self.cards = _trello.CardCollection(session, None, 'board')
+
+
+class TestWriteBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.board = FakeBoard(self.session)
+        self.card = _trello.CardEntity(
+            dict(id='card', name='[1] subject', idList='list-1',
+                 idLabels=['label-1']), self.session)
+        self.batch = _trello.WriteBatch(self.board)
+
+    def flush(self):
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            self.batch.flush(executor)
+
+    def test_changes_to_a_card_are_merged(self):
+        self.batch.move_card(self.card, _trello.ListEntity(dict(id='list-2')))
+        self.batch.add_label(self.card, _trello.LabelEntity(dict(id='l-2')))
+        self.batch.add_label(self.card, _trello.LabelEntity(dict(id='l-3')))
+        self.flush()
+
+        expected = [('PUT', 'https://trello.com/1/cards/card',
+                     dict(idList='list-2', idLabels='label-1,l-2,l-3'))]
+        self.assertEqual(expected, self.session.requests)
+        self.assertEqual('list-2', self.card.idList)
+        self.assertEqual(['label-1', 'l-2', 'l-3'], self.card.label_ids)
+
+    def test_content_changes_are_merged(self):
+        self.batch.rename_card(self.card, '[1] new subject')
+        self.batch.describe_card(self.card, 'new description')
+        self.flush()
+
+        expected = [('PUT', 'https://trello.com/1/cards/card',
+                     dict(name='[1] new subject', desc='new description'))]
+        self.assertEqual(expected, self.session.requests)
+        self.assertEqual(_utils.content_hash('new description'),
+                         self.card.descHash)
+
+    def test_unchanged_card_is_not_written(self):
+        self.batch.move_card(self.card, _trello.ListEntity(dict(id='list-1')))
+        self.batch.add_label(self.card,
+                             _trello.LabelEntity(dict(id='label-1')))
+        self.flush()
+        self.assertEqual([], self.session.requests)
+
+    def test_deleted_card_is_not_updated(self):
+        self.batch.move_card(self.card, _trello.ListEntity(dict(id='list-2')))
+        self.batch.delete_card(self.card)
+        self.flush()
+
+        expected = [('DELETE', 'https://trello.com/1/cards/card', None)]
+        self.assertEqual(expected, self.session.requests)
+
+    def test_description_is_produced_when_flushed(self):
+        calls = []
+
+        def get_description():
+            calls.append(True)
+            return 'description'
+
+        self.batch.add_card('[2] subject', get_description, 'url', None)
+        self.assertEqual([], calls)
+        self.flush()
+        self.assertEqual([True], calls)
+        self.assertEqual('description', self.session.requests[0][2]['desc'])
+
+
+class TestCardCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.cards = _trello.CardCollection(self.session, None, 'board')
+        self.cards.load([
+            dict(id='card-1', name='[1] subject', idList='list-1',
+                 idLabels=['label-1']),
+            dict(id='card-2', name='Bug #2 title', idList='list-1',
+                 idLabels=[]),
+            dict(id='card-3', name='remember the milk', idList='list-2',
+                 idLabels=['label-1']),
+        ])
+
+    def ids(self, cards):
+        return sorted(card.id for card in cards)
+
+    def test_numbers_are_parsed_when_loaded(self):
+        self.assertEqual('card-1', self.cards.get('gerrit:1').id)
+        self.assertEqual('card-2', self.cards.get('lp:2').id)
+        self.assertEqual(['card-3'], self.ids(self.cards.get_all(None)))
+
+    def test_renamed_card_is_reindexed(self):
+        card = self.cards.get('gerrit:1')
+        card.update(name='[5] subject')
+
+        self.assertIsNone(self.cards.get('gerrit:1'))
+        self.assertEqual('card-1', self.cards.get('gerrit:5').id)
+
+    def test_deleted_card_is_removed(self):
+        self.cards.get('gerrit:1').delete()
+        self.assertIsNone(self.cards.get('gerrit:1'))
+        self.assertNotIn('card-1', self.ids(self.cards))
+
+    def test_archived_card_is_removed(self):
+        self.cards.get('gerrit:1').archive()
+        self.assertEqual(
+            [('PUT', 'https://trello.com/1/cards/card-1',
+              dict(closed='true'))], self.session.requests)
+        self.assertIsNone(self.cards.get('gerrit:1'))
+
+    def test_card_that_is_already_gone_is_removed(self):
+        self.session.status_code = 404
+        self.cards.get('gerrit:1').delete()
+        self.assertIsNone(self.cards.get('gerrit:1'))
+
+    def test_failed_delete_keeps_the_card(self):
+        self.session.status_code = 500
+        self.assertRaises(Exception, self.cards.get('gerrit:1').delete)
+        self.assertEqual('card-1', self.cards.get('gerrit:1').id)
+
+    def test_reindexed_card_is_never_missing(self):
+        card = self.cards.get('gerrit:1')
+        stop = threading.Event()
+
+        def reindex():
+            while not stop.is_set():
+                self.cards._reindex(card, {})
+
+        # NOTE: switching threads often makes catching it likely
+        if hasattr(sys, 'setswitchinterval'):
+            self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+            sys.setswitchinterval(1e-6)
+        thread = threading.Thread(target=reindex)
+        thread.start()
+        try:
+            for _ in range(2000):
+                self.assertEqual([card], self.cards.get_all('gerrit:1'))
+                self.assertIn('gerrit:1', self.cards.keys())
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_entities_do_not_have_a_dict(self):
+        card = self.cards.get('gerrit:1')
+        self.assertFalse(hasattr(card, '__dict__'))
+
+
+class TestCardData(unittest.TestCase):
+
+    snapshot = (b'{"id": "board", "name": "OpenStack",'
+                b' "cards": [{"id": "card", "name": "[1] subject",'
+                b' "desc": "a long commit message", "idList": "list",'
+                b' "idLabels": ["label"], "badges": {"votes": 0}}],'
+                b' "lists": [{"id": "list", "name": "Done"}],'
+                b' "labels": [{"id": "label", "name": "review"}]}')
+
+    def test_only_the_fields_we_use_are_kept(self):
+        card = _trello.CardEntity(json.loads(self.snapshot)['cards'][0])
+        self.assertEqual(
+            dict(id='card', name='[1] subject', idList='list',
+                 idLabels=['label'],
+                 descHash=_utils.content_hash('a long commit message')),
+            card._data)
+
+    @unittest.skipIf(_trello.ijson is None, 'ijson is not installed')
+    def test_snapshot_is_parsed_incrementally(self):
+        snapshot = _trello.parse_snapshot(io.BytesIO(self.snapshot))
+        self.assertEqual('board', snapshot['id'])
+        self.assertEqual([dict(id='list', name='Done')], snapshot['lists'])
+        self.assertEqual(['card'], [card['id'] for card in snapshot['cards']])
+        self.assertNotIn('desc', snapshot['cards'][0])
+
+    def test_falling_back_is_logged_once(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('os_trello')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(setattr, _trello, '_fallback_logged',
+                        _trello._fallback_logged)
+        old_level = logger.level
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.setLevel, old_level)
+        _trello._fallback_logged = False
+
+        _trello._log_fallback()
+        _trello._log_fallback()
+        self.assertEqual(1, len(records))
@@ -52,8 +52,13 @@ setup(
         'console_scripts': [
             'os-trello-sync = os_trello.cmds.sync:main',
             'os-trello-init = os_trello.cmds.init:main',
+            'os-trello-benchmark = os_trello.cmds.benchmark:main',
         ]
     },
     install_requires=read_requirements('requirements.txt'),
+    extras_require={
+        # NOTE: streams large boards instead of loading them all at once
+        'streaming': ['ijson==2.3'],
+    },
     tests_require=read_requirements('test-requirements.txt')
 )